@@ -0,0 +1,106 @@
+"""Attendance rollups behind /api/attendances/stats.
+
+Status counts are kept in memory per (group, student, month) cell.
+Every write to the attendances collection reports to attendance_rollups
+(inserted / changed) under its lock, so the counts follow along without
+rescanning. Like the unread counters in messaging, they are rebuilt from
+the raw records on startup and whenever another process changed the
+collection.
+"""
+import threading
+from collections import Counter
+from typing import Dict, Iterable, Optional, Tuple
+
+COLLECTION = "attendances"
+STATUSES = ("approved", "rejected", "absent", "pending")
+
+def _cell(record: dict) -> Tuple[str, str, str]:
+    return (record.get("group_id"), record.get("student_id"), (record.get("lesson_date") or "")[:7])
+
+def _rates(key: str, counts: Counter) -> dict:
+    total = sum(counts.values())
+    row = {"key": key, **{status: counts.get(status, 0) for status in STATUSES}, "total": total}
+    if not total:
+        return {**row, "present_rate": 0.0, "absent_rate": 0.0, "pending_rate": 0.0}
+    # A rejected check-in counts as an absence
+    return {
+        **row,
+        "present_rate": round(row["approved"] / total, 4),
+        "absent_rate": round((row["absent"] + row["rejected"]) / total, 4),
+        "pending_rate": round(row["pending"] / total, 4)
+    }
+
+class AttendanceRollups:
+    """Status counts per (group_id, student_id, YYYY-MM) cell"""
+    
+    def __init__(self):
+        self.lock = threading.RLock()
+        self._cells: Dict[Tuple[str, str, str], Counter] = {}
+        self._version = None
+        self._built = False
+        self.rebuilds = 0
+    
+    def _add(self, record: dict, status: Optional[str], delta: int):
+        counts = self._cells.setdefault(_cell(record), Counter())
+        counts[status] += delta
+        if counts[status] <= 0:
+            del counts[status]
+    
+    def rebuild(self, db):
+        """Recount every attendance record"""
+        with self.lock:
+            version = db.collection_version(COLLECTION)
+            self._cells = {}
+            for record in db.find(COLLECTION, projection=["group_id", "student_id", "lesson_date", "status"]):
+                self._add(record, record.get("status"), 1)
+            self._version = version
+            self._built = True
+            self.rebuilds += 1
+    
+    def _ensure_current(self, db) -> bool:
+        """Rebuild if storage changed behind our back, True if rebuilt"""
+        version = db.collection_version(COLLECTION)
+        if self._built and version is self._version:
+            return False
+        self.rebuild(db)
+        return True
+    
+    def inserted(self, db, records: Iterable[dict]):
+        """Count just-inserted records"""
+        with self.lock:
+            if self._ensure_current(db):
+                return
+            for record in records:
+                self._add(record, record.get("status"), 1)
+    
+    def changed(self, db, records: Iterable[dict], old_status: Dict[str, str]):
+        """Move just-updated records from their old status (by id) to the current one"""
+        with self.lock:
+            if self._ensure_current(db):
+                return
+            for record in records:
+                self._add(record, old_status[record["id"]], -1)
+                self._add(record, record.get("status"), 1)
+    
+    def rates(self, db, group_ids: Optional[set] = None, student_id: Optional[str] = None) -> dict:
+        """Get rates per group, student and month, limited to group_ids / student_id"""
+        groups: Dict[str, Counter] = {}
+        students: Dict[str, Counter] = {}
+        months: Dict[str, Counter] = {}
+        with self.lock:
+            self._ensure_current(db)
+            for (group, student, month), counts in self._cells.items():
+                if (group_ids is not None and group not in group_ids) or (student_id is not None and student != student_id):
+                    continue
+                for table, key in ((groups, group), (students, student), (months, month)):
+                    table.setdefault(key, Counter()).update(counts)
+        return {
+            name: [_rates(key, counts) for key, counts in sorted(table.items(), key=lambda item: str(item[0]))]
+            for name, table in (("groups", groups), ("students", students), ("months", months))
+        }
+    
+    def stats(self) -> dict:
+        with self.lock:
+            return {"cells": len(self._cells), "rebuilds": self.rebuilds}
+
+attendance_rollups = AttendanceRollups()
@@ -0,0 +1,57 @@
+"""Compare snapshot codecs: dump time, load time and file size"""
+import argparse
+import os
+import random
+import tempfile
+import time
+import uuid
+from storage_codecs import CODECS, orjson
+
+def make_documents(count: int):
+    """Generate grade-like documents"""
+    elements = ["homework", "classwork", "test", "participation"]
+    return [
+        {
+            "id": str(uuid.uuid4()),
+            "studentId": f"student-{i % 5000}",
+            "lessonId": f"lesson-{i % 300}",
+            "score": round(random.uniform(0, 100), 1),
+            "element": random.choice(elements),
+            "status": "graded",
+            "createdAt": "2025-11-11T15:11:47.329474"
+        }
+        for i in range(count)
+    ]
+
+def bench(sizes, repeat: int):
+    print(f"{'codec':<12} {'docs':>9} {'dump s':>9} {'load s':>9} {'size MB':>9}")
+    print("-" * 52)
+    with tempfile.TemporaryDirectory() as tmp:
+        for count in sizes:
+            documents = make_documents(count)
+            for codec in CODECS.values():
+                if codec.name == "orjson" and orjson is None:
+                    continue
+                path = os.path.join(tmp, f"bench{codec.extension}")
+                dump_time = load_time = float("inf")
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    with open(path, "wb") as f:
+                        codec.dump(documents, f)
+                    dump_time = min(dump_time, time.perf_counter() - start)
+                    
+                    start = time.perf_counter()
+                    with open(path, "rb") as f:
+                        loaded = codec.load(f)
+                    load_time = min(load_time, time.perf_counter() - start)
+                assert len(loaded) == count
+                size = os.path.getsize(path) / (1024 * 1024)
+                print(f"{codec.name:<12} {count:>9} {dump_time:>9.3f} {load_time:>9.3f} {size:>9.1f}")
+            print("-" * 52)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--sizes", default="10000,100000,1000000", help="Comma-separated document counts")
+    parser.add_argument("--repeat", type=int, default=3, help="Best of N runs")
+    args = parser.parse_args()
+    bench([int(size) for size in args.sizes.split(",")], args.repeat)
@@ -0,0 +1,175 @@
+"""Content-addressed blob store for photos kept out of collection files.
+
+A blob's key is the SHA-256 of its bytes, stored at root/ab/cd/<key>.
+Uploads are hashed while they are copied to a temporary file, which is
+then renamed into place, or dropped if the same content already exists.
+Documents keep only the key.
+"""
+import hashlib
+import os
+import re
+import tempfile
+from io import BytesIO
+from typing import BinaryIO, Iterator, Optional, Tuple
+from fastapi import HTTPException, Request, Response
+from fastapi.responses import FileResponse, StreamingResponse
+from config import settings
+
+CHUNK_SIZE = 1024 * 1024
+_KEY_RE = re.compile(r"^[0-9a-f]{64}$")
+
+# Leading bytes of the image formats accepted for photos
+IMAGE_SIGNATURES = [
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+]
+
+def sniff_image(head: bytes) -> Optional[str]:
+    """Get the media type of an image from its first bytes, None if not an image"""
+    for signature, media_type in IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return media_type
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+class BlobTooLarge(Exception):
+    pass
+
+class BlobStore:
+    """Files under root named by the SHA-256 of their content"""
+    
+    def __init__(self, root: str):
+        self.root = root
+    
+    def path(self, key: str) -> str:
+        """Get the file path of key, ValueError if key is not a blob key"""
+        if not _KEY_RE.match(key):
+            raise ValueError(f"Invalid blob key: {key}")
+        return os.path.join(self.root, key[:2], key[2:4], key)
+    
+    def exists(self, key: str) -> bool:
+        try:
+            return os.path.exists(self.path(key))
+        except ValueError:
+            return False
+    
+    def put_stream(self, source: BinaryIO, max_bytes: int = None) -> Tuple[str, int]:
+        """Store everything read from source, returning (key, size)"""
+        tmp_dir = os.path.join(self.root, "tmp")
+        os.makedirs(tmp_dir, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=tmp_dir)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                while True:
+                    chunk = source.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if max_bytes is not None and size > max_bytes:
+                        raise BlobTooLarge(f"Larger than {max_bytes} bytes")
+                    digest.update(chunk)
+                    f.write(chunk)
+                f.flush()
+                if settings.FSYNC_WRITES:
+                    os.fsync(f.fileno())
+            key = digest.hexdigest()
+            path = self.path(key)
+            if os.path.exists(path):
+                # Same content is already stored
+                os.unlink(tmp_path)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(tmp_path, path)
+            return key, size
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+    
+    def put_bytes(self, data: bytes) -> str:
+        """Store data, returning its key"""
+        key = hashlib.sha256(data).hexdigest()
+        if not self.exists(key):
+            self.put_stream(BytesIO(data))
+        return key
+    
+    def head(self, key: str, size: int = 16) -> bytes:
+        """Read the first bytes of a blob"""
+        with open(self.path(key), "rb") as f:
+            return f.read(size)
+
+def _parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Parse a single "bytes=start-end" range into inclusive offsets.
+    
+    None means serve the whole blob (multiple ranges are not supported,
+    which RFC 9110 allows); an unsatisfiable range raises 416.
+    """
+    units, _, spec = header.partition("=")
+    if units.strip() != "bytes" or "," in spec:
+        return None
+    first, _, last = spec.strip().partition("-")
+    try:
+        if first:
+            start = int(first)
+            end = int(last) if last else size - 1
+        else:
+            # Suffix range: the last N bytes
+            start = max(size - int(last), 0)
+            end = size - 1
+    except ValueError:
+        return None
+    if start > end or start >= size:
+        raise HTTPException(
+            status_code=416,
+            detail="Range not satisfiable",
+            headers={"Content-Range": f"bytes */{size}"}
+        )
+    return start, min(end, size - 1)
+
+def _read_range(path: str, start: int, end: int) -> Iterator[bytes]:
+    with open(path, "rb") as f:
+        f.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = f.read(min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+def serve_blob(store: "BlobStore", key: str, request: Request) -> Response:
+    """Respond with a blob, honoring If-None-Match and Range.
+    
+    Content never changes for a key, so the key is the ETag and clients
+    may cache the response indefinitely.
+    """
+    if not store.exists(key):
+        raise HTTPException(status_code=404, detail="Photo not found")
+    path = store.path(key)
+    etag = f'"{key}"'
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "private, max-age=31536000, immutable"
+    }
+    if etag in request.headers.get("if-none-match", "") or request.headers.get("if-none-match") == "*":
+        return Response(status_code=304, headers=headers)
+    media_type = sniff_image(store.head(key)) or "application/octet-stream"
+    size = os.path.getsize(path)
+    byte_range = None
+    if_range = request.headers.get("if-range")
+    if "range" in request.headers and (if_range is None or if_range == etag):
+        byte_range = _parse_range(request.headers["range"], size)
+    if byte_range is None:
+        return FileResponse(path, media_type=media_type, headers=headers)
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+    return StreamingResponse(_read_range(path, start, end), status_code=206, media_type=media_type, headers=headers)
+
+blob_store = BlobStore(settings.BLOB_DIR or os.path.join(settings.DATA_DIR, "blobs"))
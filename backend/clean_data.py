@@ -30,7 +30,13 @@ def clean_all_data():
         
         # Write empty array to file
         with open(file_path, "w") as f:
-            json.dump([], f, indent=2)
+            json.dump([], f)
+        
+        # Drop pending journal records and binary snapshots so they don't win over it
+        for suffix in (".journal", ".bin"):
+            extra_path = os.path.join(DATA_DIR, f"{collection}{suffix}")
+            if os.path.exists(extra_path):
+                os.remove(extra_path)
         
         print(f"✓ {collection}.json tozalandi")
     
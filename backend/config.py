@@ -18,6 +18,62 @@ class Settings(BaseSettings):
     # JSON Data Directory
     DATA_DIR: str = os.path.join(os.path.dirname(__file__), "data")
     
+    # Storage: "snapshot" rewrites a collection file per write,
+    # "journal" appends per-mutation records and compacts in the background
+    STORAGE_MODE: str = "snapshot"
+    JOURNAL_COMPACT_BYTES: int = 4 * 1024 * 1024
+    
+    # Group commit: when > 0, writes are flushed by a background thread at most
+    # once per interval per collection (or when the batch size is reached).
+    # Unflushed state lives in one process, so keep a single worker with it.
+    WRITE_COALESCE_MS: int = 0
+    WRITE_COALESCE_BATCH: int = 500
+    
+    # fsync collection files and journals on every write
+    FSYNC_WRITES: bool = True
+    
+    # Snapshot format: "json" (compact), "json-pretty", "orjson" or "binary".
+    # Existing .json files are converted the first time they are loaded.
+    STORAGE_CODEC: str = "json"
+    
+    # Storage backend: "json" (files in DATA_DIR) or "sqlite"
+    STORAGE_BACKEND: str = "json"
+    SQLITE_PATH: str = os.path.join(os.path.dirname(__file__), "data", "education.db")
+    
+    # bcrypt cost; stored hashes with another cost are replaced on login
+    BCRYPT_ROUNDS: int = 12
+    # Concurrent bcrypt operations per process
+    PASSWORD_HASH_CONCURRENCY: int = 4
+    # Worker processes for bulk user import hashing (0 = CPU count)
+    PASSWORD_IMPORT_WORKERS: int = 0
+    USER_IMPORT_MAX_ROWS: int = 5000
+    
+    # Authenticated user cache used by get_current_user
+    PRINCIPAL_CACHE_SIZE: int = 10000
+    PRINCIPAL_CACHE_TTL: int = 60
+    
+    # WebSocket: server ping interval (a client silent for two intervals is
+    # dropped) and per-connection outgoing queue size before disconnecting
+    WS_HEARTBEAT_SECONDS: int = 25
+    WS_QUEUE_SIZE: int = 100
+    
+    # Content-addressed photo storage (default: DATA_DIR/blobs) and upload limit
+    BLOB_DIR: str = ""
+    PHOTO_MAX_BYTES: int = 10 * 1024 * 1024
+    
+    # Check-in photo verification: feature extractor ("thumbnail" needs Pillow,
+    # "histogram", or "module:function"), feature worker threads, how long to
+    # collect check-ins into one scoring batch, and the cosine similarity
+    # at which a photo counts as verified
+    PHOTO_FEATURE_EXTRACTOR: str = "thumbnail"
+    PHOTO_SCORING_WORKERS: int = 2
+    PHOTO_SCORING_BATCH_MS: int = 200
+    PHOTO_MATCH_THRESHOLD: float = 0.8
+    
+    # List endpoints: default and maximum ?limit= page size
+    PAGE_SIZE: int = 100
+    MAX_PAGE_SIZE: int = 1000
+    
     class Config:
         env_file = ".env"
 
@@ -1,82 +1,977 @@
+import atexit
+import bisect
+import copy
 import json
 import os
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
+from itertools import islice
 from pathlib import Path
-from typing import Any, List, Optional
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
 from config import settings
+from query import apply_update, compile_query, is_hashable, plan_query, project, sort_key
+from storage_codecs import Codec, get_codec
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process locking, run a single worker
+    fcntl = None
 from datetime import datetime
 import uuid
 
+def replay_journal(journal_path: str, data: List[dict]) -> List[dict]:
+    """Apply journal records on top of snapshot data.
+
+    Replay is idempotent, so records that were already folded into the
+    snapshot by an interrupted compaction are harmless.
+    """
+    if not os.path.exists(journal_path):
+        return data
+    
+    docs = {}
+    for item in data:
+        docs[item.get("id") or object()] = item
+    with open(journal_path, "r") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # Torn last line from an interrupted append
+                break
+            op = record.get("op")
+            if op == "insert":
+                docs[record["doc"]["id"]] = record["doc"]
+            elif op == "update" and record["id"] in docs:
+                docs[record["id"]] = {**docs[record["id"]], **record["set"]}
+            elif op == "delete":
+                docs.pop(record["id"], None)
+    return list(docs.values())
+
+def _detach(doc: dict) -> dict:
+    """Copy doc deeply enough that it shares no list or dict with the resident copy"""
+    return {key: copy.deepcopy(value) if isinstance(value, (list, dict)) else value for key, value in doc.items()}
+
 # Ensure data directory exists
 os.makedirs(settings.DATA_DIR, exist_ok=True)
 
+# Secondary indexes built for every JSONDatabase unless overridden.
+# The primary "id" index always exists.
+DEFAULT_INDEXES = {
+    "users": ["email"],
+    "groups": ["teacher_id", "student_ids"],
+    "grades": ["studentId", "lessonId"],
+    "lessons": ["groupId", "teacherId"],
+    "messages": ["receiver_id"],
+    "attendances": ["group_id", "student_id"],
+    "test_results": ["testId", "studentId"],
+    "video_courses": ["teacher_id", "allowed_group_ids"],
+    "exams": ["teacher_id", "group_ids"],
+    "course_access_requests": ["student_id"],
+    "conversation_reads": ["user_id"],
+    "conversations": ["user_id"],
+    "photo_references": ["student_id"]
+}
+
+# Collections whose files are created empty on startup; the rest
+# appear on first write
+COLLECTIONS = [
+    "users",
+    "lessons",
+    "grades",
+    "tests",
+    "test_results",
+    "courses",
+    "course_progress",
+    "attendance"
+]
+
+# Fields kept in sorted order for every collection, so sorted and
+# paginated finds walk the index from the cursor instead of sorting
+DEFAULT_ORDERED_INDEXES = ["createdAt"]
+
+# (partition field, sort field) pairs kept in sorted order per partition
+# value, so a sorted find on one partition (e.g. one conversation) reads
+# only that partition
+DEFAULT_PARTITIONED_INDEXES = {
+    "messages": [("conversation_key", "created_at")]
+}
+
+class CollectionData:
+    """Resident copy of one collection.
+
+    Documents are kept in insertion order keyed by id (the primary index),
+    and each secondary index maps a field value to the ids holding it.
+    Array fields are indexed by element. Ordered indexes keep
+    (sort_key(value), sort_key(id), seq, key) entries sorted by value then
+    id; partitioned indexes keep the same entries in one sorted list per
+    value of the partition field. Access to docs and indexes goes through
+    lock.
+    """
+    
+    def __init__(
+        self,
+        documents: List[dict],
+        fields: List[str] = (),
+        ordered: List[str] = (),
+        partitioned: List[Tuple[str, str]] = ()
+    ):
+        self.lock = threading.RLock()
+        self.docs: Dict[Any, dict] = {}
+        # Insertion sequence per key, used to return index hits in stored order
+        self.seq: Dict[Any, int] = {}
+        self.next_seq = 0
+        self.indexes: Dict[str, Dict[Any, Dict[Any, None]]] = {}
+        self.ordered: Dict[str, List[tuple]] = {}
+        self.partitions: Dict[Tuple[str, str], Dict[Any, List[tuple]]] = {}
+        for doc in documents:
+            self._store(self._primary_key(doc), doc)
+        for field in fields:
+            self.ensure_index(field)
+        for field in ordered:
+            self.ensure_ordered_index(field)
+        for partition, field in partitioned:
+            self.ensure_partitioned_index(partition, field)
+    
+    def _primary_key(self, doc: dict) -> Any:
+        key = doc.get("id")
+        if key is None or not is_hashable(key) or key in self.docs:
+            # Legacy documents without a usable id get a private key
+            return object()
+        return key
+    
+    def ensure_index(self, field: str):
+        """Build index on field if it does not exist yet"""
+        with self.lock:
+            if field == "id" or field in self.indexes:
+                return
+            self.indexes[field] = {}
+            for key, doc in self.docs.items():
+                self._index_doc(field, key, doc)
+    
+    def ensure_ordered_index(self, field: str):
+        """Build sorted index on field if it does not exist yet"""
+        with self.lock:
+            if field in self.ordered:
+                return
+            self.ordered[field] = sorted(self._order_entry(field, key, doc) for key, doc in self.docs.items())
+    
+    def ensure_partitioned_index(self, partition: str, field: str):
+        """Build per-partition sorted index if it does not exist yet"""
+        with self.lock:
+            if (partition, field) in self.partitions:
+                return
+            self.partitions[(partition, field)] = {}
+            for key, doc in self.docs.items():
+                self._partition_doc(partition, field, key, doc)
+            for entries in self.partitions[(partition, field)].values():
+                entries.sort()
+    
+    @staticmethod
+    def _partition_value(doc: dict, partition: str) -> Any:
+        value = doc.get(partition)
+        return value if value is not None and is_hashable(value) else None
+    
+    def _partition_doc(self, partition: str, field: str, key: Any, doc: dict):
+        value = self._partition_value(doc, partition)
+        if value is not None:
+            entries = self.partitions[(partition, field)].setdefault(value, [])
+            # Appends in the usual case of documents arriving in field order
+            bisect.insort(entries, self._order_entry(field, key, doc))
+    
+    def _unpartition_doc(self, partition: str, field: str, key: Any, doc: dict):
+        value = self._partition_value(doc, partition)
+        index = self.partitions[(partition, field)]
+        entries = index.get(value)
+        if entries is None:
+            return
+        entry = self._order_entry(field, key, doc)
+        i = bisect.bisect_left(entries, entry)
+        if i < len(entries) and entries[i] == entry:
+            del entries[i]
+            if not entries:
+                del index[value]
+    
+    def _order_entry(self, field: str, key: Any, doc: dict) -> tuple:
+        return (sort_key(doc.get(field)), sort_key(doc.get("id")), self.seq[key], key)
+    
+    def _order_doc(self, field: str, key: Any, doc: dict):
+        bisect.insort(self.ordered[field], self._order_entry(field, key, doc))
+    
+    def _unorder_doc(self, field: str, key: Any, doc: dict):
+        entries = self.ordered[field]
+        entry = self._order_entry(field, key, doc)
+        i = bisect.bisect_left(entries, entry)
+        if i < len(entries) and entries[i] == entry:
+            del entries[i]
+    
+    def _store(self, key: Any, doc: dict):
+        self.docs[key] = doc
+        self.seq[key] = self.next_seq
+        self.next_seq += 1
+    
+    @staticmethod
+    def _index_values(doc: dict, field: str) -> List[Any]:
+        if field not in doc:
+            return []
+        value = doc[field]
+        values = value if isinstance(value, list) else [value]
+        return [v for v in values if is_hashable(v)]
+    
+    def _index_doc(self, field: str, key: Any, doc: dict):
+        index = self.indexes[field]
+        for value in self._index_values(doc, field):
+            index.setdefault(value, {})[key] = None
+    
+    def _unindex_doc(self, field: str, key: Any, doc: dict):
+        index = self.indexes[field]
+        for value in self._index_values(doc, field):
+            bucket = index.get(value)
+            if bucket is not None:
+                bucket.pop(key, None)
+                if not bucket:
+                    del index[value]
+    
+    def values(self) -> List[dict]:
+        """Get all documents in insertion order"""
+        with self.lock:
+            return list(self.docs.values())
+    
+    def insert(self, doc: dict) -> Any:
+        """Add document and index it, returning its primary key"""
+        with self.lock:
+            key = self._primary_key(doc)
+            self._store(key, doc)
+            for field in self.indexes:
+                self._index_doc(field, key, doc)
+            for field in self.ordered:
+                self._order_doc(field, key, doc)
+            for partition, field in self.partitions:
+                self._partition_doc(partition, field, key, doc)
+            return key
+    
+    def replace(self, key: Any, doc: dict):
+        """Swap in a new version of the document stored under key"""
+        with self.lock:
+            old = self.docs[key]
+            for field in self.indexes:
+                self._unindex_doc(field, key, old)
+            for field in self.ordered:
+                if old.get(field) != doc.get(field) or old.get("id") != doc.get("id"):
+                    self._unorder_doc(field, key, old)
+                    self._order_doc(field, key, doc)
+            for partition, field in self.partitions:
+                if any(old.get(name) != doc.get(name) for name in (partition, field, "id")):
+                    self._unpartition_doc(partition, field, key, old)
+                    self._partition_doc(partition, field, key, doc)
+            self.docs[key] = doc
+            for field in self.indexes:
+                self._index_doc(field, key, doc)
+    
+    def remove(self, key: Any):
+        """Drop the document stored under key"""
+        with self.lock:
+            doc = self.docs[key]
+            for field in self.ordered:
+                self._unorder_doc(field, key, doc)
+            for partition, field in self.partitions:
+                self._unpartition_doc(partition, field, key, doc)
+            del self.docs[key]
+            del self.seq[key]
+            for field in self.indexes:
+                self._unindex_doc(field, key, doc)
+    
+    def lookup(self, field: str, value: Any) -> Optional[Iterable[Any]]:
+        """Get keys of documents whose field holds value, None if not indexed"""
+        if field == "id":
+            return [value] if value in self.docs else []
+        index = self.indexes.get(field)
+        if index is None:
+            return None
+        return index.get(value, ())
+    
+    def match(
+        self,
+        query: dict = None,
+        sort: Tuple[str, int] = None,
+        limit: int = None,
+        after: list = None
+    ) -> List[Tuple[Any, dict]]:
+        """Get (key, document) pairs matching query.
+        
+        Without sort, results are in insertion order. sort is (field, 1) or
+        (field, -1), ties broken by id; after is the [value, id] position
+        of the last document already seen. Scanning stops once limit
+        documents matched.
+        """
+        with self.lock:
+            predicate = compile_query(query)
+            keys = plan_query(query, self.lookup)
+            if sort is None:
+                if after is not None:
+                    raise ValueError("after requires sort")
+                if keys is None:
+                    candidates = self.docs.items()
+                else:
+                    candidates = ((key, self.docs[key]) for key in sorted(keys, key=self.seq.__getitem__))
+                return self._take(((key, doc) for key, doc in candidates if predicate(doc)), limit)
+            
+            field, direction = sort
+            bound = None if after is None else (sort_key(after[0]), sort_key(after[1]))
+            entries = self._partition_entries(query, field)
+            if entries is None:
+                entries = self.ordered.get(field)
+            if entries is None or (keys is not None and entries is self.ordered.get(field)):
+                # Sort the candidates: index hits are usually few, and
+                # unindexed sort fields have nothing better
+                source = self.docs if keys is None else keys
+                entries = sorted(
+                    self._order_entry(field, key, self.docs[key]) for key in source
+                    if predicate(self.docs[key])
+                )
+                predicate = compile_query(None)
+            if direction >= 0:
+                start = 0 if bound is None else bisect.bisect_right(entries, bound + (float("inf"),))
+                positions = range(start, len(entries))
+            else:
+                end = len(entries) if bound is None else bisect.bisect_left(entries, bound + (-1,))
+                positions = range(end - 1, -1, -1)
+            return self._take(
+                ((entry[3], self.docs[entry[3]]) for entry in map(entries.__getitem__, positions)
+                 if predicate(self.docs[entry[3]])),
+                limit
+            )
+    
+    def _partition_entries(self, query: Optional[dict], field: str) -> Optional[List[tuple]]:
+        """Get the sorted entries of the partition query pins down, if indexed"""
+        if not query:
+            return None
+        for partition, sort_field in self.partitions:
+            value = query.get(partition)
+            if sort_field == field and value is not None and not isinstance(value, dict) and is_hashable(value):
+                return self.partitions[(partition, sort_field)].get(value, [])
+        return None
+    
+    @staticmethod
+    def _take(pairs: Iterable[Tuple[Any, dict]], limit: Optional[int]) -> List[Tuple[Any, dict]]:
+        if limit is None:
+            return list(pairs)
+        return list(islice(pairs, limit))
+
+class CollectionCache:
+    """Process-wide cache of parsed collection files.
+
+    Entries are keyed by file path and validated against a signature of
+    the collection's files ((mtime, size, inode) each) plus the write
+    generation kept in its lock file, so a collection is only re-parsed
+    when another writer actually changed it.
+    """
+    
+    def __init__(self):
+        self._entries: Dict[str, Tuple[tuple, CollectionData]] = {}
+        # Paths whose cached data is ahead of the file (unflushed writes)
+        self._pinned = set()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    @staticmethod
+    def signature(path: str) -> Optional[tuple]:
+        """Get file signature used to detect changes, None if missing"""
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+    
+    def get(self, path: str, signature: Optional[tuple]) -> Optional[CollectionData]:
+        """Return cached data if it is still valid for signature"""
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None and (path in self._pinned or (signature is not None and entry[0] == signature)):
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+    
+    def put(self, path: str, signature: Optional[tuple], data: CollectionData):
+        """Store parsed data for path"""
+        with self._lock:
+            if signature is None:
+                self._entries.pop(path, None)
+            else:
+                self._entries[path] = (signature, data)
+    
+    def pin(self, path: str, data: CollectionData):
+        """Serve data for path regardless of the file until unpinned"""
+        with self._lock:
+            self._pinned.add(path)
+            self._entries[path] = (None, data)
+    
+    def unpin(self, path: str, signature: Optional[tuple]):
+        """Resume validating path against the file, now written with signature"""
+        with self._lock:
+            self._pinned.discard(path)
+            entry = self._entries.get(path)
+            if entry is not None:
+                if signature is None:
+                    del self._entries[path]
+                else:
+                    self._entries[path] = (signature, entry[1])
+    
+    def invalidate(self, path: str = None):
+        """Drop one cached collection, or all of them"""
+        with self._lock:
+            if path is None:
+                self._entries.clear()
+                self._pinned.clear()
+            else:
+                self._entries.pop(path, None)
+                self._pinned.discard(path)
+    
+    def stats(self) -> dict:
+        """Get hit/miss counters"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "collections": len(self._entries),
+                "unflushed": len(self._pinned)
+            }
+
+class GroupCommitWriter:
+    """Coalesces JSONDatabase writes into periodic background flushes.
+
+    Mutations are applied to the resident collection right away and only
+    mark the collection dirty. A single flusher thread persists each dirty
+    collection once per interval, or sooner when batch_size mutations are
+    pending. Every submit returns the Future of the flush that will cover it.
+    """
+    
+    def __init__(self, db: "JSONDatabase", interval: float, batch_size: int):
+        self.db = db
+        self.interval = interval
+        self.batch_size = batch_size
+        self._cond = threading.Condition()
+        # collection -> {"records": journal records, "full": needs snapshot rewrite}
+        self._pending: Dict[str, dict] = {}
+        self._pending_count = 0
+        self._first_dirty: Optional[float] = None
+        self._flush_requested = False
+        self._closed = False
+        self._next_future = Future()
+        self._inflight: Optional[Future] = None
+        self.flushes = 0
+        self.coalesced_writes = 0
+        self._thread = threading.Thread(target=self._run, name="group-commit", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+    
+    def submit(self, collection: str, records: Optional[List[dict]], data: CollectionData = None) -> Future:
+        """Mark collection dirty; records None requests a full snapshot write.
+
+        data, the already mutated resident copy, stays pinned in the cache
+        until it has been flushed.
+        """
+        with self._cond:
+            if data is not None:
+                self.db.cache.pin(self.db.get_collection_path(collection), data)
+            entry = self._pending.setdefault(collection, {"records": [], "full": False})
+            if records is None:
+                entry["full"] = True
+            else:
+                entry["records"].extend(records)
+            self._pending_count += 1
+            if self._first_dirty is None:
+                self._first_dirty = time.monotonic()
+                self._cond.notify()
+            elif self._pending_count >= self.batch_size:
+                self._cond.notify()
+            return self._next_future
+    
+    def is_dirty(self, collection: str) -> bool:
+        with self._cond:
+            return collection in self._pending
+    
+    def flush(self) -> Future:
+        """Flush now; the Future resolves once earlier writes are on disk"""
+        with self._cond:
+            if not self._pending:
+                if self._inflight is not None:
+                    return self._inflight
+                done = Future()
+                done.set_result(None)
+                return done
+            self._flush_requested = True
+            self._cond.notify()
+            return self._next_future
+    
+    def close(self):
+        """Flush pending writes and stop the flusher"""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+    
+    def stats(self) -> dict:
+        with self._cond:
+            return {
+                "flushes": self.flushes,
+                "coalesced_writes": self.coalesced_writes,
+                "pending_collections": len(self._pending)
+            }
+    
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    if not self._pending:
+                        if self._closed:
+                            return
+                        self._cond.wait()
+                        continue
+                    remaining = self._first_dirty + self.interval - time.monotonic()
+                    if (self._closed or self._flush_requested
+                            or self._pending_count >= self.batch_size or remaining <= 0):
+                        break
+                    self._cond.wait(remaining)
+                pending, self._pending = self._pending, {}
+                future, self._next_future = self._next_future, Future()
+                self.coalesced_writes += self._pending_count
+                self._pending_count = 0
+                self._first_dirty = None
+                self._flush_requested = False
+                self._inflight = future
+            self._flush(pending, future)
+    
+    def _flush(self, pending: Dict[str, dict], future: Future):
+        failed = []
+        for collection, entry in pending.items():
+            data = self.db.load_collection(collection)
+            records = None if entry["full"] else entry["records"]
+            path = self.db.get_collection_path(collection)
+            with self.db.file_lock(collection):
+                persisted = self.db._persist(collection, data, records)
+            if persisted:
+                with self._cond:
+                    if collection not in self._pending:
+                        self.db.cache.unpin(path, self.db._signature(collection))
+            else:
+                failed.append(collection)
+                # Data is still resident; retry with a full rewrite next round
+                self.submit(collection, None)
+        with self._cond:
+            self.flushes += 1
+            if self._inflight is future:
+                self._inflight = None
+        if failed:
+            future.set_exception(IOError(f"Failed to flush: {', '.join(failed)}"))
+        else:
+            future.set_result(None)
+
+# Shared by every JSONDatabase instance in the process
+collection_cache = CollectionCache()
+
 class JSONDatabase:
     """Simple JSON file-based database for storing application data"""
     
-    def __init__(self, data_dir: str = settings.DATA_DIR):
+    # Serializes read-modify-write cycles across all instances
+    _write_lock = threading.RLock()
+    
+    # Collection file locks held by the current thread, so nested reads
+    # under a write lock don't try to take a conflicting shared lock
+    _held_locks = threading.local()
+    
+    # Collections with a background compaction in flight
+    _compacting = set()
+    
+    def __init__(
+        self,
+        data_dir: str = settings.DATA_DIR,
+        cache: CollectionCache = collection_cache,
+        storage_mode: str = None,
+        indexes: Dict[str, List[str]] = None,
+        codec: str = None,
+        ordered_indexes: List[str] = None,
+        partitioned_indexes: Dict[str, List[Tuple[str, str]]] = None
+    ):
         self.data_dir = data_dir
+        # Snapshot file format, see storage_codecs
+        self.codec: Codec = get_codec(codec or settings.STORAGE_CODEC)
+        self.cache = cache
+        self.indexes = {**DEFAULT_INDEXES, **(indexes or {})}
+        self.ordered_indexes = list(DEFAULT_ORDERED_INDEXES if ordered_indexes is None else ordered_indexes)
+        self.partitioned_indexes = {**DEFAULT_PARTITIONED_INDEXES, **(partitioned_indexes or {})}
+        # "snapshot" rewrites the collection file on every mutation,
+        # "journal" appends one record per mutation and compacts later
+        self.storage_mode = storage_mode or settings.STORAGE_MODE
+        self.journal_compact_bytes = settings.JOURNAL_COMPACT_BYTES
+        # collection -> descriptor of its lock file, read for the write generation
+        self._generation_fds: Dict[str, int] = {}
         self.initialize_collections()
+        # Optional group commit: persist dirty collections at most once per interval
+        self.writer = None
+        if settings.WRITE_COALESCE_MS > 0:
+            self.writer = GroupCommitWriter(
+                self, settings.WRITE_COALESCE_MS / 1000, settings.WRITE_COALESCE_BATCH
+            )
     
     def initialize_collections(self):
         """Initialize JSON collection files"""
-        collections = [
-            "users",
-            "lessons",
-            "grades",
-            "tests",
-            "test_results",
-            "courses",
-            "course_progress",
-            "attendance"
-        ]
-        
-        for collection in collections:
-            file_path = os.path.join(self.data_dir, f"{collection}.json")
-            if not os.path.exists(file_path):
-                with open(file_path, "w") as f:
-                    json.dump([], f, indent=2)
-                print(f"✓ Created {collection}.json")
+        for collection in COLLECTIONS:
+            file_path = self.get_collection_path(collection)
+            if not os.path.exists(file_path) and not os.path.exists(self.get_legacy_path(collection)):
+                try:
+                    # Exclusive create: another worker may be starting up too
+                    with open(file_path, "xb") as f:
+                        self.codec.dump([], f)
+                except FileExistsError:
+                    continue
+                print(f"✓ Created {os.path.basename(file_path)}")
     
     def get_collection_path(self, collection: str) -> str:
         """Get file path for collection"""
+        return os.path.join(self.data_dir, f"{collection}{self.codec.extension}")
+    
+    def get_legacy_path(self, collection: str) -> str:
+        """Get path of the JSON file a non-JSON codec converts from"""
         return os.path.join(self.data_dir, f"{collection}.json")
     
+    def get_journal_path(self, collection: str) -> str:
+        """Get journal file path for collection"""
+        return os.path.join(self.data_dir, f"{collection}.journal")
+    
+    def get_lock_path(self, collection: str) -> str:
+        """Get lock file path for collection"""
+        return os.path.join(self.data_dir, f"{collection}.lock")
+    
+    @contextmanager
+    def file_lock(self, collection: str, exclusive: bool = True):
+        """Hold a cross-process lock on collection files.
+
+        Writers take it exclusively, readers parsing the files share it.
+        Every acquisition opens its own descriptor, so flock also excludes
+        other threads of this process.
+        """
+        held = self._held_locks.__dict__.setdefault("collections", {})
+        key = (self.data_dir, collection)
+        if fcntl is None or held.get(key, False) or (key in held and not exclusive):
+            yield
+            return
+        fd = os.open(self.get_lock_path(collection), os.O_RDWR | os.O_CREAT, 0o644)
+        previous = held.get(key)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            held[key] = exclusive
+            yield
+        finally:
+            if previous is None:
+                held.pop(key, None)
+            else:
+                held[key] = previous
+            os.close(fd)
+    
+    @contextmanager
+    def _exclusive(self, collection: str):
+        """Lock collection against other threads and processes for read-modify-write"""
+        with self._write_lock, self.file_lock(collection):
+            yield
+    
+    def _generation_fd(self, collection: str) -> int:
+        fd = self._generation_fds.get(collection)
+        if fd is None:
+            fd = os.open(self.get_lock_path(collection), os.O_RDWR | os.O_CREAT, 0o644)
+            fd = self._generation_fds.setdefault(collection, fd)
+        return fd
+    
+    def _generation(self, collection: str) -> int:
+        """Get the number of writes to collection, from its lock file.
+        
+        Files are replaced through rename, so a freed inode can come back
+        with the same size and mtime tick; the generation tells such states
+        apart.
+        """
+        if not hasattr(os, "pread"):
+            return 0
+        data = os.pread(self._generation_fd(collection), 8, 0)
+        return int.from_bytes(data, "little") if len(data) == 8 else 0
+    
+    def _bump_generation(self, collection: str):
+        """Count a write to collection; callers hold its exclusive file lock"""
+        if hasattr(os, "pwrite"):
+            os.pwrite(self._generation_fd(collection), (self._generation(collection) + 1).to_bytes(8, "little"), 0)
+    
+    def _signature(self, collection: str) -> Optional[tuple]:
+        """Get cache signature covering every file the collection is built
+        from and its write generation, None if no file exists yet"""
+        files = (self.cache.signature(self.get_collection_path(collection)),)
+        if self.storage_mode == "journal":
+            files += (self.cache.signature(self.get_journal_path(collection)),)
+        if all(signature is None for signature in files):
+            return None
+        return (*files, self._generation(collection))
+    
+    def load_collection(self, collection: str) -> CollectionData:
+        """Get resident copy of collection, parsing the file only on cache miss"""
+        path = self.get_collection_path(collection)
+        data = self.cache.get(path, self._signature(collection))
+        if data is None:
+            if path != self.get_legacy_path(collection) and not os.path.exists(path):
+                self._convert_legacy(collection)
+            with self.file_lock(collection, exclusive=False):
+                # Taken under the lock, so snapshot and journal are read as one state
+                signature = self._signature(collection)
+                try:
+                    if not os.path.exists(path):
+                        # Not written yet (collections are created on first write)
+                        documents = []
+                    else:
+                        with open(path, "rb") as f:
+                            documents = self.codec.load(f)
+                    if self.storage_mode == "journal":
+                        documents = self._replay_journal(collection, documents)
+                except Exception as e:
+                    print(f"Error reading {collection}: {e}")
+                    return CollectionData([])
+            data = CollectionData(
+                documents,
+                self.indexes.get(collection, []),
+                self.ordered_indexes,
+                self.partitioned_indexes.get(collection, [])
+            )
+            self.cache.put(path, signature, data)
+            return data
+        for field in self.indexes.get(collection, []):
+            data.ensure_index(field)
+        for field in self.ordered_indexes:
+            data.ensure_ordered_index(field)
+        for partition, field in self.partitioned_indexes.get(collection, []):
+            data.ensure_partitioned_index(partition, field)
+        return data
+    
+    def _convert_legacy(self, collection: str):
+        """Rewrite a collection's .json file in the configured codec, once"""
+        legacy_path = self.get_legacy_path(collection)
+        with self._exclusive(collection):
+            if os.path.exists(self.get_collection_path(collection)) or not os.path.exists(legacy_path):
+                return
+            try:
+                with open(legacy_path, "rb") as f:
+                    documents = json.load(f)
+                if self.storage_mode == "journal":
+                    documents = self._replay_journal(collection, documents)
+            except Exception as e:
+                print(f"Error converting {collection}: {e}")
+                return
+            if self._write_snapshot(collection, documents):
+                os.remove(legacy_path)
+                print(f"✓ Converted {collection}.json -> {self.codec.name}")
+    
+    def ensure_index(self, collection: str, field: str):
+        """Declare a secondary index on collection field"""
+        fields = self.indexes.setdefault(collection, [])
+        if field not in fields:
+            self.indexes[collection] = fields + [field]
+        self.load_collection(collection).ensure_index(field)
+    
+    def _replay_journal(self, collection: str, data: List[dict]) -> List[dict]:
+        """Apply the collection's journal records on top of snapshot data"""
+        return replay_journal(self.get_journal_path(collection), data)
+    
     def read_collection(self, collection: str) -> List[dict]:
         """Read all items from collection"""
+        return [_detach(doc) for doc in self.load_collection(collection).values()]
+    
+    def collection_version(self, collection: str) -> Any:
+        """Get a token that is replaced (compare with `is`) when collection
+        is reloaded because another process changed its file"""
+        signature = self._signature(collection)
+        if signature is None:
+            # Not written yet: every load would give a fresh empty copy
+            return None
+        return self.load_collection(collection)
+    
+    def list_collections(self) -> List[str]:
+        """Get names of collections that exist on disk"""
+        suffixes = (self.codec.extension, ".json", ".journal")
+        names = {
+            os.path.splitext(name)[0] for name in os.listdir(self.data_dir)
+            if name.endswith(suffixes) and not name.endswith(".tmp")
+        }
+        return sorted(names)
+    
+    def warm_up(self) -> Dict[str, dict]:
+        """Load and index every collection, returning per-collection timings"""
+        timings = {}
+        for collection in self.list_collections():
+            start = time.perf_counter()
+            data = self.load_collection(collection)
+            timings[collection] = {
+                "documents": len(data.docs),
+                "ms": round((time.perf_counter() - start) * 1000, 1)
+            }
+        return timings
+    
+    def _write_snapshot(self, collection: str, documents: List[dict]) -> bool:
+        """Write all documents to the collection file"""
+        path = self.get_collection_path(collection)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
         try:
-            with open(self.get_collection_path(collection), "r") as f:
-                return json.load(f)
+            # Before the files change: a reader seeing the new generation
+            # re-parses under the shared lock, i.e. after this write
+            self._bump_generation(collection)
+            # Readers see either the old or the new file, never a half-written one
+            with open(tmp_path, "wb") as f:
+                self.codec.dump(documents, f)
+                self._sync(f)
+            os.replace(tmp_path, path)
+            self._sync_dir()
+            if self.storage_mode == "journal":
+                # Only emptied once the snapshot holding its records is durable
+                with open(self.get_journal_path(collection), "w") as f:
+                    self._sync(f)
         except Exception as e:
-            print(f"Error reading {collection}: {e}")
-            return []
+            print(f"Error writing {collection}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            return False
+        return True
+    
+    def _sync(self, f):
+        """Flush file to disk when FSYNC_WRITES is enabled"""
+        f.flush()
+        if settings.FSYNC_WRITES:
+            os.fsync(f.fileno())
+    
+    def _sync_dir(self):
+        """Make a rename in data_dir durable"""
+        if not settings.FSYNC_WRITES or not hasattr(os, "O_DIRECTORY"):
+            return
+        fd = os.open(self.data_dir, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
     
     def write_collection(self, collection: str, data: List[dict]):
         """Write all items to collection"""
+        with self._exclusive(collection):
+            self._commit(collection, CollectionData([_detach(doc) for doc in data], self.indexes.get(collection, [])), None)
+    
+    def append_journal(self, collection: str, records: List[dict]) -> bool:
+        """Append mutation records to the collection journal"""
+        journal_path = self.get_journal_path(collection)
         try:
-            with open(self.get_collection_path(collection), "w") as f:
-                json.dump(data, f, indent=2)
+            self._bump_generation(collection)
+            with open(journal_path, "a") as f:
+                f.write("".join(json.dumps(record) + "\n" for record in records))
+                self._sync(f)
         except Exception as e:
-            print(f"Error writing {collection}: {e}")
+            print(f"Error writing {collection} journal: {e}")
+            return False
+        
+        if os.path.getsize(journal_path) >= self.journal_compact_bytes:
+            self.schedule_compaction(collection)
+        return True
     
-    def find(self, collection: str, query: dict = None) -> List[dict]:
-        """Find items matching query"""
-        data = self.read_collection(collection)
-        if not query:
-            return data
+    def _persist(self, collection: str, data: CollectionData, records: Optional[List[dict]]) -> bool:
+        """Write a mutation to disk, as journal records when possible"""
+        if self.storage_mode == "journal" and records is not None:
+            return self.append_journal(collection, records)
+        return self._write_snapshot(collection, data.values())
+    
+    def _commit(self, collection: str, data: CollectionData, records: Optional[List[dict]]):
+        """Persist a mutation already applied to data.
+
+        With group commit the write is handed to the flusher and data stays
+        pinned in the cache until then. Otherwise it is written now, and if
+        that fails the cached copy is dropped so the next read reflects
+        what is on disk.
+        """
+        path = self.get_collection_path(collection)
+        if self.writer is not None:
+            self.writer.submit(collection, records, data)
+        elif self._persist(collection, data, records):
+            self.cache.put(path, self._signature(collection), data)
+        else:
+            self.cache.invalidate(path)
+    
+    def flush(self) -> Future:
+        """Get a Future that resolves once all earlier writes are on disk"""
+        if self.writer is not None:
+            return self.writer.flush()
+        done = Future()
+        done.set_result(None)
+        return done
+    
+    def close(self):
+        """Flush pending writes and stop background work"""
+        if self.writer is not None:
+            self.writer.close()
+        fds, self._generation_fds = self._generation_fds, {}
+        for fd in fds.values():
+            os.close(fd)
+    
+    def schedule_compaction(self, collection: str):
+        """Fold the journal into a new snapshot on a background thread"""
+        if self.writer is not None:
+            # The flusher thread owns the files, let it rewrite the snapshot
+            self.writer.submit(collection, None)
+            return
+        with self._write_lock:
+            if collection in self._compacting:
+                return
+            self._compacting.add(collection)
+        threading.Thread(
+            target=self.compact, args=(collection,), name=f"compact-{collection}", daemon=True
+        ).start()
+    
+    def compact(self, collection: str):
+        """Write current state as snapshot and truncate the journal"""
+        try:
+            with self._exclusive(collection):
+                self._commit(collection, self.load_collection(collection), None)
+        finally:
+            with self._write_lock:
+                self._compacting.discard(collection)
+    
+    def cache_stats(self) -> dict:
+        """Get collection cache hit/miss counters"""
+        stats = self.cache.stats()
+        if self.writer is not None:
+            stats["group_commit"] = self.writer.stats()
+        return stats
+    
+    def find(
+        self,
+        collection: str,
+        query: dict = None,
+        sort: Tuple[str, int] = None,
+        limit: int = None,
+        after: list = None,
+        projection: List[str] = None
+    ) -> List[dict]:
+        """Find items matching query.
         
-        results = []
-        for item in data:
-            match = True
-            for key, value in query.items():
-                if key not in item or item[key] != value:
-                    match = False
-                    break
-            if match:
-                results.append(item)
-        return results
+        sort is (field, 1 or -1); after is the [sort value, id] of the last
+        item of the previous page. See CollectionData.match. With
+        projection, only those fields are copied out of each document.
+        """
+        matched = self.load_collection(collection).match(query, sort, limit, after)
+        if projection is not None:
+            return [_detach(project(item, projection)) for _, item in matched]
+        # Callers may edit nested lists in place, which must not reach the
+        # resident copy (or its indexes) behind update_one's back
+        return [_detach(item) for _, item in matched]
     
     def find_one(self, collection: str, query: dict) -> Optional[dict]:
         """Find single item matching query"""
-        results = self.find(collection, query)
+        results = self.find(collection, query, limit=1)
         return results[0] if results else None
     
     def find_by_id(self, collection: str, id: str) -> Optional[dict]:
@@ -85,16 +980,7 @@ class JSONDatabase:
     
     def insert_one(self, collection: str, document: dict) -> dict:
         """Insert single document and return it with generated ID"""
-        if "id" not in document:
-            document["id"] = str(uuid.uuid4())
-        if "createdAt" not in document:
-            document["createdAt"] = datetime.utcnow().isoformat()
-        
-        data = self.read_collection(collection)
-        data.append(document)
-        self.write_collection(collection, data)
-        
-        return document
+        return self.insert_many(collection, [document])[0]
     
     def insert_many(self, collection: str, documents: List[dict]) -> List[dict]:
         """Insert multiple documents"""
@@ -104,42 +990,124 @@ class JSONDatabase:
             if "createdAt" not in doc:
                 doc["createdAt"] = datetime.utcnow().isoformat()
         
-        data = self.read_collection(collection)
-        data.extend(documents)
-        self.write_collection(collection, data)
-        return documents
+        with self._exclusive(collection):
+            data = self.load_collection(collection)
+            for doc in documents:
+                data.insert(_detach(doc))
+            self._commit(collection, data, [{"op": "insert", "doc": doc} for doc in documents])
+        return [dict(doc) for doc in documents]
     
     def update_one(self, collection: str, query: dict, update: dict) -> Optional[dict]:
         """Update single document"""
-        data = self.read_collection(collection)
-        for i, item in enumerate(data):
-            match = True
-            for key, value in query.items():
-                if key not in item or item[key] != value:
-                    match = False
-                    break
-            if match:
-                data[i].update(update)
-                data[i]["updatedAt"] = datetime.utcnow().isoformat()
-                self.write_collection(collection, data)
-                return data[i]
-        return None
+        with self._exclusive(collection):
+            data = self.load_collection(collection)
+            matched = data.match(query, limit=1)
+            if not matched:
+                return None
+            key, item = matched[0]
+            # Replace rather than mutate so documents already handed out stay unchanged
+            changes = _detach({**apply_update(item, update), "updatedAt": datetime.utcnow().isoformat()})
+            updated = {**item, **changes}
+            data.replace(key, updated)
+            records = [{"op": "update", "id": item["id"], "set": changes}] if "id" in item else None
+            self._commit(collection, data, records)
+            return _detach(updated)
     
     def update_by_id(self, collection: str, id: str, update: dict) -> Optional[dict]:
         """Update document by ID"""
         return self.update_one(collection, {"id": id}, update)
     
+    def update_many(self, collection: str, query: dict, update: dict) -> int:
+        """Update every document matching query in one write, returning the count"""
+        with self._exclusive(collection):
+            data = self.load_collection(collection)
+            matched = data.match(query)
+            if not matched:
+                return 0
+            now = datetime.utcnow().isoformat()
+            records = []
+            for key, item in matched:
+                changes = _detach({**apply_update(item, update), "updatedAt": now})
+                data.replace(key, {**item, **changes})
+                records.append({"op": "update", "id": item.get("id"), "set": changes})
+            if not all(record["id"] is not None for record in records):
+                records = None
+            self._commit(collection, data, records)
+            return len(matched)
+    
+    def bulk_write(
+        self,
+        collection: str,
+        updates: List[Tuple[dict, dict]] = (),
+        inserts: List[dict] = (),
+        upserts: List[dict] = (),
+        upsert_key: Sequence[str] = ("id",)
+    ) -> Tuple[List[dict], List[dict]]:
+        """Apply (query, update) pairs like update_many, then inserts, in one write.
+        
+        Each of upserts is an update holding the upsert_key fields: it is
+        applied to the latest document matching those fields, or inserted
+        as a new document if there is none, decided under the write lock.
+        Upserts that would change nothing are skipped. Returns the updated
+        and the inserted documents.
+        """
+        now = datetime.utcnow().isoformat()
+        inserted = list(inserts)
+        for doc in inserts:
+            doc.setdefault("id", str(uuid.uuid4()))
+            doc.setdefault("createdAt", now)
+        with self._exclusive(collection):
+            data = self.load_collection(collection)
+            records = []
+            updated = []
+            for query, update in updates:
+                for key, item in data.match(query):
+                    changes = _detach({**apply_update(item, update), "updatedAt": now})
+                    updated.append({**item, **changes})
+                    data.replace(key, updated[-1])
+                    records.append({"op": "update", "id": item.get("id"), "set": changes})
+            for doc in inserts:
+                data.insert(_detach(doc))
+                records.append({"op": "insert", "doc": doc})
+            for upsert in upserts:
+                matched = data.match({field: upsert[field] for field in upsert_key})
+                if matched:
+                    key, item = max(matched, key=lambda match: str(match[1].get("createdAt") or ""))
+                    changes = _detach(apply_update(item, upsert))
+                    if all(field in item and item[field] == value for field, value in changes.items()):
+                        continue
+                    changes["updatedAt"] = now
+                    updated.append({**item, **changes})
+                    data.replace(key, updated[-1])
+                    records.append({"op": "update", "id": item.get("id"), "set": changes})
+                else:
+                    doc = apply_update({}, upsert, inserting=True)
+                    doc.setdefault("id", str(uuid.uuid4()))
+                    doc.setdefault("createdAt", now)
+                    inserted.append(doc)
+                    data.insert(_detach(doc))
+                    records.append({"op": "insert", "doc": doc})
+            if not records:
+                return [], []
+            if any(record["op"] == "update" and record["id"] is None for record in records):
+                records = None
+            self._commit(collection, data, records)
+        return [_detach(doc) for doc in updated], [dict(doc) for doc in inserted]
+    
     def delete_one(self, collection: str, query: dict) -> bool:
         """Delete single document"""
-        data = self.read_collection(collection)
-        original_len = len(data)
-        data = [item for item in data if not all(
-            item.get(key) == value for key, value in query.items()
-        )]
-        if len(data) < original_len:
-            self.write_collection(collection, data)
+        with self._exclusive(collection):
+            data = self.load_collection(collection)
+            removed = data.match(query)
+            if not removed:
+                return False
+            for key, _ in removed:
+                data.remove(key)
+            records = [{"op": "delete", "id": item["id"]} for _, item in removed]
+            if not all("id" in item for _, item in removed):
+                records = None
+            self._commit(collection, data, records)
             return True
-        return False
     
     def delete_by_id(self, collection: str, id: str) -> bool:
         """Delete document by ID"""
@@ -147,11 +1115,32 @@ class JSONDatabase:
     
     def count(self, collection: str, query: dict = None) -> int:
         """Count documents in collection"""
-        return len(self.find(collection, query))
+        return len(self.load_collection(collection).match(query))
+
+def create_database():
+    """Create the storage backend selected by settings.STORAGE_BACKEND"""
+    if settings.STORAGE_BACKEND == "sqlite":
+        from sqlite_database import SQLiteDatabase
+        return SQLiteDatabase()
+    return JSONDatabase()
 
-# Global database instance
-db = JSONDatabase()
+# Shared storage instance, created by main.lifespan (or on first use in scripts)
+_db = None
+_db_lock = threading.Lock()
 
 def get_db() -> JSONDatabase:
-    """Get database instance"""
-    return db
+    """Get the shared database instance, used as a FastAPI dependency"""
+    global _db
+    if _db is None:
+        with _db_lock:
+            if _db is None:
+                _db = create_database()
+    return _db
+
+def close_db():
+    """Flush and drop the shared database instance"""
+    global _db
+    with _db_lock:
+        if _db is not None:
+            _db.close()
+            _db = None
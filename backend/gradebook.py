@@ -0,0 +1,136 @@
+"""Weighted gradebook behind /api/gradebook.
+
+A group's grades are laid out as a student x lesson x element score
+array (NaN where there is no grade) next to a lesson x element weight
+array taken from each lesson's assessmentElements. Weighted lesson
+scores, and the per-student and per-lesson averages over them, are
+computed with whole-array NumPy operations.
+
+Results are cached per group. Grade and lesson writes and group
+membership changes invalidate the groups they touch, and the whole cache
+is dropped when another process changed grades, lessons or groups.
+"""
+import threading
+from typing import Dict, Iterable, List, Optional
+import numpy as np
+
+def _nan_to_none(value: float) -> Optional[float]:
+    return None if np.isnan(value) else round(float(value), 2)
+
+def compute_gradebook(group: dict, lessons: List[dict], grades: List[dict]) -> dict:
+    """Weighted averages of grades for group's lessons"""
+    lesson_ids = [lesson["id"] for lesson in lessons]
+    lesson_pos = {lesson_id: i for i, lesson_id in enumerate(lesson_ids)}
+    student_ids = list(dict.fromkeys([*group.get("student_ids", []), *(g["studentId"] for g in grades)]))
+    student_pos = {student_id: i for i, student_id in enumerate(student_ids)}
+    elements = list(dict.fromkeys(
+        [e["name"] for lesson in lessons for e in lesson.get("assessmentElements") or []]
+        + [g["element"] for g in grades]
+    ))
+    element_pos = {name: i for i, name in enumerate(elements)}
+    
+    scores = np.full((len(student_ids), len(lesson_ids), len(elements)), np.nan)
+    if grades:
+        # Later grades for the same cell overwrite earlier ones
+        ordered = sorted(grades, key=lambda g: str(g.get("createdAt") or ""))
+        scores[
+            [student_pos[g["studentId"]] for g in ordered],
+            [lesson_pos[g["lessonId"]] for g in ordered],
+            [element_pos[g["element"]] for g in ordered]
+        ] = [float(g["score"]) for g in ordered]
+    
+    weights = np.zeros((len(lesson_ids), len(elements)))
+    for i, lesson in enumerate(lessons):
+        declared = lesson.get("assessmentElements") or []
+        if declared:
+            for element in declared:
+                weights[i, element_pos[element["name"]]] = element["weight"]
+        else:
+            # Lessons without declared elements weigh every element equally
+            weights[i, :] = 1
+    
+    graded = ~np.isnan(scores)
+    effective = np.where(graded, weights[None, :, :], 0)
+    total_weight = effective.sum(axis=2)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        lesson_scores = (np.where(graded, scores, 0) * effective).sum(axis=2) / total_weight
+        lesson_scores[total_weight == 0] = np.nan
+        has_score = ~np.isnan(lesson_scores)
+        student_avg = np.where(has_score, lesson_scores, 0).sum(axis=1) / has_score.sum(axis=1)
+        lesson_avg = np.where(has_score, lesson_scores, 0).sum(axis=0) / has_score.sum(axis=0)
+    
+    return {
+        "groupId": group["id"],
+        "lessons": [
+            {
+                "lessonId": lesson["id"],
+                "title": lesson.get("title"),
+                "elements": lesson.get("assessmentElements") or [],
+                "average": _nan_to_none(lesson_avg[i])
+            }
+            for i, lesson in enumerate(lessons)
+        ],
+        "students": [
+            {
+                "studentId": student_id,
+                "average": _nan_to_none(student_avg[s]),
+                "lessons": {
+                    lesson_id: _nan_to_none(lesson_scores[s, i])
+                    for i, lesson_id in enumerate(lesson_ids) if has_score[s, i]
+                }
+            }
+            for s, student_id in enumerate(student_ids)
+        ]
+    }
+
+class GradebookCache:
+    """Computed gradebooks per group id"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries: Dict[str, dict] = {}
+        self._versions = None
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, db, group: dict) -> dict:
+        """Get group's gradebook, computing it on a miss"""
+        versions = tuple(db.collection_version(name) for name in ("grades", "lessons", "groups"))
+        with self._lock:
+            if self._versions is None or not all(a is b for a, b in zip(versions, self._versions)):
+                self._entries.clear()
+                self._versions = versions
+                self._generation += 1
+            generation = self._generation
+            cached = self._entries.get(group["id"])
+            if cached is not None:
+                self.hits += 1
+                return cached
+            self.misses += 1
+        lessons = db.find("lessons", {"groupId": group["id"]}, sort=("createdAt", 1))
+        grades = db.find("grades", {"lessonId": {"$in": [lesson["id"] for lesson in lessons]}}) if lessons else []
+        result = compute_gradebook(group, lessons, grades)
+        with self._lock:
+            # Don't keep a result computed while the group was invalidated
+            if self._generation == generation:
+                self._entries[group["id"]] = result
+        return result
+    
+    def invalidate(self, group_ids: Iterable[Optional[str]]):
+        """Drop the gradebooks of group_ids"""
+        with self._lock:
+            self._generation += 1
+            for group_id in group_ids:
+                self._entries.pop(group_id, None)
+    
+    def invalidate_lessons(self, db, lesson_ids: Iterable[str]):
+        """Drop the gradebooks of the groups the lessons belong to"""
+        lessons = db.find("lessons", {"id": {"$in": list(set(lesson_ids))}}, projection=["groupId"])
+        self.invalidate(lesson.get("groupId") for lesson in lessons)
+    
+    def stats(self) -> dict:
+        with self._lock:
+            return {"groups": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+gradebook_cache = GradebookCache()
@@ -1,19 +1,27 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 from contextlib import asynccontextmanager
+import asyncio
 import os
+import time
 from config import settings
-from routes import auth, users, lessons, grades, tests, courses, groups, video_courses, exams, chats, attendances
-from database import JSONDatabase
-from security import get_password_hash
+from routes import auth, users, lessons, grades, gradebook, tests, courses, groups, video_courses, exams, chats, attendances, ws
+from database import get_db, close_db
+from security import get_password_hash, principal_cache
+from passwords import password_hasher
+from realtime import hub
+from messaging import backfill_conversation_keys, rebuild_inbox, unread_counters
+from attendance_stats import attendance_rollups
+from photo_similarity import similarity_engine
+from gradebook import gradebook_cache
 from datetime import datetime
 
 # Create data directory
 os.makedirs("data", exist_ok=True)
 
-def initialize_default_data():
+def initialize_default_data(db):
     """Initialize default super admin user if not exists"""
-    db = JSONDatabase()
     users = db.find("users", {})
     
     # Check if super admin exists
@@ -31,7 +39,7 @@ def initialize_default_data():
             "group_id": None,
             "created_at": datetime.utcnow().isoformat()
         }
-        db.insert("users", default_admin)
+        db.insert_one("users", default_admin)
         print("=" * 60)
         print("✅ TOZA SAYT - FAQAT SUPER ADMIN YARATILDI!")
         print("=" * 60)
@@ -47,12 +55,33 @@ def initialize_default_data():
         print("✅ Super Admin allaqachon mavjud")
         print("📧 Email: admin@education.uz")
 
+async def warm_up(app: FastAPI, db):
+    """Preload and index every collection, then mark the worker ready"""
+    start = time.perf_counter()
+    timings = await asyncio.to_thread(db.warm_up)
+    await asyncio.to_thread(backfill_conversation_keys, db)
+    await asyncio.to_thread(rebuild_inbox, db)
+    await asyncio.to_thread(unread_counters.rebuild, db)
+    await asyncio.to_thread(attendance_rollups.rebuild, db)
+    for collection, timing in timings.items():
+        print(f"  🔥 {collection}: {timing['documents']} ta hujjat, {timing['ms']} ms")
+    print(f"✅ Ma'lumotlar yuklandi: {len(timings)} ta kolleksiya, {(time.perf_counter() - start) * 1000:.0f} ms")
+    app.state.ready = True
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    # Startup
-    initialize_default_data()
+    # Startup: one storage instance shared by every request through Depends(get_db)
+    app.state.ready = False
+    db = get_db()
+    initialize_default_data(db)
+    warm_up_task = asyncio.create_task(warm_up(app, db))
     yield
-    # Shutdown (if needed)
+    await warm_up_task
+    # Shutdown: score queued check-in photos, then persist writes still
+    # queued for group commit
+    await asyncio.to_thread(similarity_engine.close)
+    close_db()
+    password_hasher.close()
 
 app = FastAPI(
     title="Education Platform API",
@@ -83,8 +112,10 @@ app.include_router(chats.router, prefix="/api/chats", tags=["Chats"])
 app.include_router(attendances.router, prefix="/api/attendances", tags=["Attendances"])
 app.include_router(lessons.router, prefix="/api/lessons", tags=["Lessons"])
 app.include_router(grades.router, prefix="/api/grades", tags=["Grades"])
+app.include_router(gradebook.router, prefix="/api/gradebook", tags=["Grades"])
 app.include_router(tests.router, prefix="/api/tests", tags=["Tests"])
 app.include_router(courses.router, prefix="/api/courses", tags=["Courses"])
+app.include_router(ws.router)
 
 @app.get("/")
 async def root():
@@ -99,6 +130,30 @@ async def root():
 async def health():
     return {"status": "healthy"}
 
+@app.get("/health/ready")
+async def readiness():
+    """Ready only after storage warm-up, for load balancer health checks"""
+    if not getattr(app.state, "ready", False):
+        return JSONResponse(status_code=503, content={"status": "warming_up"})
+    return {"status": "ready"}
+
+@app.get("/health/auth")
+async def auth_health():
+    return {"principal_cache": principal_cache.stats(), "password_hashing": password_hasher.stats()}
+
+@app.get("/health/realtime")
+async def realtime_health():
+    return {"websocket": hub.stats(), "unread_counters": unread_counters.stats()}
+
+@app.get("/health/storage")
+async def storage_health():
+    return {
+        "cache": get_db().cache_stats(),
+        "attendance_rollups": attendance_rollups.stats(),
+        "photo_scoring": similarity_engine.stats(),
+        "gradebook": gradebook_cache.stats()
+    }
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(
@@ -0,0 +1,225 @@
+"""Chat messages and read state.
+
+All message inserts go through post_message, which also pushes the
+message to the receiver's WebSocket connections. Messages carry a
+conversation_key shared by both directions of a conversation; storage
+keeps each conversation sorted by created_at (a partitioned index), so
+a chat page reads only that conversation.
+
+Instead of flipping is_read on every message, each user has one read
+marker per conversation partner: the created_at of the newest message
+from that partner they have seen. A message is read if its legacy
+is_read flag is set or it is not newer than the receiver's marker.
+
+Unread counts per receiver and per (receiver, sender) are kept in
+memory by UnreadCounters: built from the data on startup, incremented by
+post_message and recounted for one conversation when its marker moves.
+
+Each user also has one summary document per conversation partner in
+the conversations collection (the inbox). Both participants' summaries
+are upserted with one write on every message.
+"""
+import threading
+from datetime import datetime
+from typing import Dict, Optional
+from realtime import hub
+
+READS = "conversation_reads"
+INBOX = "conversations"
+
+# Characters of message content kept in inbox summaries
+PREVIEW_LENGTH = 100
+
+class UnreadCounters:
+    """Materialized unread message counts.
+    
+    The counts are rebuilt whenever storage reports a new version of the
+    messages or conversation_reads collections, i.e. when another worker
+    process wrote them, so every process converges on the data.
+    """
+    
+    def __init__(self):
+        self.lock = threading.RLock()
+        # receiver id -> sender id -> unread count
+        self._counts: Dict[str, Dict[str, int]] = {}
+        self._totals: Dict[str, int] = {}
+        self._versions: Optional[tuple] = None
+        self.rebuilds = 0
+    
+    @staticmethod
+    def _current_versions(db) -> tuple:
+        return (db.collection_version("messages"), db.collection_version(READS))
+    
+    def rebuild(self, db):
+        """Recount every unread message from the stored data"""
+        with self.lock:
+            versions = self._current_versions(db)
+            markers = {
+                (marker["user_id"], marker["peer_id"]): marker["read_at"]
+                for marker in db.find(READS)
+            }
+            counts: Dict[str, Dict[str, int]] = {}
+            for msg in db.find("messages", {"is_read": {"$ne": True}}, projection=["sender_id", "receiver_id", "created_at"]):
+                receiver, sender = msg["receiver_id"], msg["sender_id"]
+                if not is_read(msg, markers.get((receiver, sender))):
+                    by_sender = counts.setdefault(receiver, {})
+                    by_sender[sender] = by_sender.get(sender, 0) + 1
+            self._counts = counts
+            self._totals = {receiver: sum(by_sender.values()) for receiver, by_sender in counts.items()}
+            self._versions = versions
+            self.rebuilds += 1
+    
+    def _ensure_current(self, db) -> bool:
+        """Rebuild if storage changed behind our back, True if rebuilt"""
+        versions = self._current_versions(db)
+        if self._versions is not None and all(a is b for a, b in zip(versions, self._versions)):
+            return False
+        self.rebuild(db)
+        return True
+    
+    def added(self, db, message: dict):
+        """Count a just-inserted unread message"""
+        with self.lock:
+            if self._ensure_current(db):
+                return
+            receiver, sender = message["receiver_id"], message["sender_id"]
+            by_sender = self._counts.setdefault(receiver, {})
+            by_sender[sender] = by_sender.get(sender, 0) + 1
+            self._totals[receiver] = self._totals.get(receiver, 0) + 1
+    
+    def recount(self, db, receiver: str, sender: str):
+        """Recount one conversation after the receiver's marker moved"""
+        with self.lock:
+            if self._ensure_current(db):
+                return
+            marker = get_read_marker(db, receiver, sender)
+            query = {"receiver_id": receiver, "sender_id": sender, "is_read": {"$ne": True}}
+            if marker is not None:
+                query["created_at"] = {"$gt": marker}
+            count = db.count("messages", query)
+            by_sender = self._counts.setdefault(receiver, {})
+            delta = count - by_sender.get(sender, 0)
+            if count:
+                by_sender[sender] = count
+            else:
+                by_sender.pop(sender, None)
+            self._totals[receiver] = self._totals.get(receiver, 0) + delta
+    
+    def total(self, db, user_id: str) -> int:
+        """Get the number of unread messages for user"""
+        with self.lock:
+            self._ensure_current(db)
+            return self._totals.get(user_id, 0)
+    
+    def by_sender(self, db, user_id: str) -> Dict[str, int]:
+        """Get sender id -> unread count for user"""
+        with self.lock:
+            self._ensure_current(db)
+            return dict(self._counts.get(user_id, {}))
+    
+    def stats(self) -> dict:
+        with self.lock:
+            return {"receivers": len(self._totals), "rebuilds": self.rebuilds}
+
+unread_counters = UnreadCounters()
+
+def conversation_key(user_id: str, peer_id: str) -> str:
+    """Get the key shared by both directions of a conversation"""
+    return ":".join(sorted((user_id, peer_id)))
+
+def backfill_conversation_keys(db) -> int:
+    """Add conversation_key to messages stored before it existed, returning the count"""
+    missing = {"conversation_key": {"$exists": False}}
+    pairs = {
+        conversation_key(msg["sender_id"], msg["receiver_id"]): (msg["sender_id"], msg["receiver_id"])
+        for msg in db.find("messages", missing, projection=["sender_id", "receiver_id"])
+    }
+    updated = 0
+    for key, (a, b) in pairs.items():
+        updated += db.update_many("messages", {**missing, "$or": [
+            {"sender_id": a, "receiver_id": b},
+            {"sender_id": b, "receiver_id": a}
+        ]}, {"conversation_key": key})
+    return updated
+
+def post_message(db, message: dict, event_type: str = "message", **payload) -> dict:
+    """Store a message and push it to the receiver.
+    
+    event_type and payload describe what the message is about, e.g.
+    ("attendance_request", attendance=...), for clients that react to it.
+    """
+    message = {
+        **message,
+        "conversation_key": conversation_key(message["sender_id"], message["receiver_id"]),
+        "is_read": False,
+        "created_at": datetime.now().isoformat()
+    }
+    with unread_counters.lock:
+        result = db.insert_one("messages", message)
+        unread_counters.added(db, result)
+        # Both participants' inbox entries in one write, upserted by id under
+        # the storage lock so concurrent workers cannot duplicate them
+        db.bulk_write(INBOX, upserts=[
+            {"id": _marker_id(user_id, peer_id), **_summary(user_id, peer_id, result)}
+            for user_id, peer_id in {(result["sender_id"], result["receiver_id"]), (result["receiver_id"], result["sender_id"])}
+        ])
+    hub.publish(result["receiver_id"], {"type": event_type, "message": result, **payload})
+    return result
+
+def _marker_id(user_id: str, peer_id: str) -> str:
+    return f"{user_id}:{peer_id}"
+
+def _summary(user_id: str, peer_id: str, message: dict) -> dict:
+    return {
+        "user_id": user_id,
+        "peer_id": peer_id,
+        "last_message_id": message["id"],
+        "last_sender_id": message["sender_id"],
+        "last_message_type": message.get("message_type"),
+        "last_message": (message.get("content") or "")[:PREVIEW_LENGTH],
+        "last_message_at": message["created_at"]
+    }
+
+def rebuild_inbox(db) -> int:
+    """Build the inbox from stored messages if it was never built, returning entries made"""
+    if db.count(INBOX) or not db.count("messages"):
+        return 0
+    latest: Dict[tuple, dict] = {}
+    for msg in db.find("messages", projection=["id", "sender_id", "receiver_id", "message_type", "content", "created_at"]):
+        for pair in ((msg["sender_id"], msg["receiver_id"]), (msg["receiver_id"], msg["sender_id"])):
+            current = latest.get(pair)
+            if current is None or msg["created_at"] >= current["created_at"]:
+                latest[pair] = msg
+    # Only fill in missing entries, so a concurrent rebuild or a newer
+    # summary written by post_message in the meantime is left as it is
+    _, inserted = db.bulk_write(INBOX, upserts=[
+        {"id": _marker_id(*pair), "$setOnInsert": _summary(*pair, msg)} for pair, msg in latest.items()
+    ])
+    return len(inserted)
+
+def get_read_marker(db, user_id: str, peer_id: str) -> Optional[str]:
+    """Get the read-up-to timestamp of user in the conversation with peer"""
+    marker = db.find_by_id(READS, _marker_id(user_id, peer_id))
+    return marker["read_at"] if marker else None
+
+def get_read_markers(db, user_id: str) -> Dict[str, str]:
+    """Get peer id -> read-up-to timestamp for all conversations of user"""
+    return {marker["peer_id"]: marker["read_at"] for marker in db.find(READS, {"user_id": user_id})}
+
+def mark_read(db, user_id: str, peer_id: str, up_to: str) -> bool:
+    """Move user's marker for peer forward to up_to, in at most one write"""
+    with unread_counters.lock:
+        # $max keeps the marker moving forward only, decided under the write lock
+        updated, inserted = db.bulk_write(READS, upserts=[
+            {"id": _marker_id(user_id, peer_id), "user_id": user_id, "peer_id": peer_id, "$max": {"read_at": up_to}}
+        ])
+        if not updated and not inserted:
+            return False
+        unread_counters.recount(db, user_id, peer_id)
+    return True
+
+def is_read(message: dict, marker: Optional[str]) -> bool:
+    """Whether the receiver has read message, given their marker for the sender"""
+    if message.get("is_read"):
+        return True
+    return marker is not None and message.get("created_at", "") <= marker
@@ -0,0 +1,69 @@
+"""Import data/*.json collections into the SQLite backend"""
+import argparse
+import os
+from contextlib import contextmanager
+from typing import List
+from config import settings
+from database import fcntl, replay_journal
+from sqlite_database import SQLiteDatabase
+from storage_codecs import CODECS
+
+@contextmanager
+def shared_lock(data_dir: str, collection: str):
+    """Hold the collection's lock shared if it exists, so no writer is mid-way"""
+    lock_path = os.path.join(data_dir, f"{collection}.lock")
+    if fcntl is None or not os.path.exists(lock_path):
+        yield
+        return
+    fd = os.open(lock_path, os.O_RDONLY)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_SH)
+        yield
+    finally:
+        os.close(fd)
+
+def read_source(data_dir: str, collection: str) -> List[dict]:
+    """Read a collection's snapshot and journal without changing data_dir.
+    
+    A JSONDatabase over data_dir would create missing files and convert
+    legacy .json files to the configured codec, so the files are read as
+    they are instead.
+    """
+    with shared_lock(data_dir, collection):
+        documents = []
+        for codec in (CODECS["binary"], CODECS["json"]):
+            path = os.path.join(data_dir, f"{collection}{codec.extension}")
+            if os.path.exists(path):
+                with open(path, "rb") as f:
+                    documents = codec.load(f)
+                break
+        return replay_journal(os.path.join(data_dir, f"{collection}.journal"), documents)
+
+def migrate(data_dir: str, sqlite_path: str, replace: bool = False):
+    """Copy every collection file in data_dir into the SQLite database"""
+    target = SQLiteDatabase(path=sqlite_path)
+    
+    collections = sorted({
+        os.path.splitext(name)[0] for name in os.listdir(data_dir)
+        if name.endswith((".json", ".bin", ".journal"))
+    })
+    
+    print(f"📦 {data_dir} -> {sqlite_path}")
+    print("=" * 60)
+    for collection in collections:
+        documents = read_source(data_dir, collection)
+        if not replace and target.count(collection) > 0:
+            print(f"- {collection}: allaqachon mavjud, o'tkazib yuborildi (--replace)")
+            continue
+        target.import_collection(collection, documents, replace=replace)
+        print(f"✓ {collection}: {len(documents)} ta hujjat")
+    print("=" * 60)
+    print("✅ Migratsiya tugadi. STORAGE_BACKEND=sqlite bilan ishga tushiring")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--data-dir", default=settings.DATA_DIR)
+    parser.add_argument("--sqlite-path", default=settings.SQLITE_PATH)
+    parser.add_argument("--replace", action="store_true", help="Overwrite tables that already have rows")
+    args = parser.parse_args()
+    migrate(args.data_dir, args.sqlite_path, args.replace)
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional
+from typing import List, Literal, Optional
 
 class AttendanceBase(BaseModel):
     student_id: str
@@ -7,7 +7,8 @@ class AttendanceBase(BaseModel):
     lesson_date: str
     lesson_time: str
     check_in_time: Optional[str] = None
-    status: str  # "pending", "approved", "absent"
+    photo_key: Optional[str] = None  # blob key from POST /api/attendances/photos
+    status: str  # "pending", "approved", "rejected", "absent"
     
 class AttendanceCreate(AttendanceBase):
     pass
@@ -19,6 +20,51 @@ class Attendance(AttendanceBase):
     id: str
     created_at: str
     updated_at: str
+    # Set by server-side photo scoring, None until scored or without references
+    similarity: Optional[float] = None
+    photo_verified: Optional[bool] = None
 
 class AttendanceResponse(Attendance):
     pass
+
+class AttendanceBulkUpdate(BaseModel):
+    """Decide pending check-ins of one lesson, or of the listed records"""
+    status: Literal["approved", "rejected"]
+    ids: Optional[List[str]] = None
+    group_id: Optional[str] = None
+    lesson_date: Optional[str] = None
+    lesson_time: Optional[str] = None
+
+class AttendanceBulkResult(BaseModel):
+    status: str
+    updated: int
+    absent_student_ids: List[str]
+
+class PhotoUpload(BaseModel):
+    key: str
+    size: int
+    content_type: str
+
+class PhotoReferenceCreate(BaseModel):
+    student_id: str
+    photo_key: str
+
+class PhotoReference(PhotoReferenceCreate):
+    id: str
+    extractor: str
+
+class AttendanceRates(BaseModel):
+    key: str  # group id, student id or YYYY-MM
+    approved: int
+    rejected: int
+    absent: int
+    pending: int
+    total: int
+    present_rate: float
+    absent_rate: float
+    pending_rate: float
+
+class AttendanceStats(BaseModel):
+    groups: List[AttendanceRates]
+    students: List[AttendanceRates]
+    months: List[AttendanceRates]
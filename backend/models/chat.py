@@ -15,3 +15,12 @@ class Message(MessageBase):
     id: str
     is_read: bool = False
     created_at: str
+
+class ConversationSummary(BaseModel):
+    peer_id: str
+    last_message_id: str
+    last_sender_id: str
+    last_message_type: Optional[str] = None
+    last_message: str
+    last_message_at: str
+    unread_count: int = 0
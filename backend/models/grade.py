@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import Optional, Literal
+from typing import Dict, List, Optional, Literal
 from datetime import datetime
 
 class GradeBase(BaseModel):
@@ -16,6 +16,10 @@ class GradeUpdate(BaseModel):
     element: Optional[str] = None
     status: Optional[Literal["graded", "pending"]] = None
 
+class GradeBulkUpsert(BaseModel):
+    lessonId: str
+    scores: Dict[str, Dict[str, float]]  # student id -> element -> score
+
 class GradeResponse(GradeBase):
     id: str
     status: Literal["graded", "pending"]
@@ -23,3 +27,29 @@ class GradeResponse(GradeBase):
 
     class Config:
         from_attributes = True
+
+class GradeBulkResult(BaseModel):
+    inserted: int
+    updated: int
+    unchanged: int
+    grades: List[GradeResponse]  # the inserted and updated cells
+
+class GradebookElement(BaseModel):
+    name: str
+    weight: int
+
+class GradebookLesson(BaseModel):
+    lessonId: str
+    title: Optional[str] = None
+    elements: List[GradebookElement]
+    average: Optional[float] = None
+
+class GradebookStudent(BaseModel):
+    studentId: str
+    average: Optional[float] = None
+    lessons: Dict[str, float]  # lesson id -> weighted score
+
+class Gradebook(BaseModel):
+    groupId: str
+    lessons: List[GradebookLesson]
+    students: List[GradebookStudent]
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, EmailStr
-from typing import Optional
+from typing import List, Optional
 from enum import Enum
 
 class UserRole(str, Enum):
@@ -32,6 +32,18 @@ class UserResponse(UserBase):
     id: str
     created_at: str
 
+class UserImportRow(BaseModel):
+    row: int
+    email: Optional[str] = None
+    status: str  # "created", "error"
+    id: Optional[str] = None
+    error: Optional[str] = None
+
+class UserImportReport(BaseModel):
+    created: int
+    failed: int
+    rows: List[UserImportRow]
+
 class LoginRequest(BaseModel):
     email: EmailStr
     password: str
@@ -0,0 +1,73 @@
+import base64
+import json
+from typing import List, Optional, Tuple
+from fastapi import HTTPException, Query, Response, status
+from config import settings
+
+# Response header carrying the cursor of the next page (absent on the last page)
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+# Every collection gets createdAt on insert, and it has an ordered index
+DEFAULT_SORT = ("createdAt", 1)
+
+def encode_cursor(values: list) -> str:
+    """Encode a [sort value, id] position as an opaque URL-safe token"""
+    raw = json.dumps(values, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> list:
+    """Decode a token made by encode_cursor"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except ValueError:
+        values = None
+    if not isinstance(values, list) or len(values) != 2:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid cursor"
+        )
+    return values
+
+class PageParams:
+    """limit/cursor query parameters shared by list endpoints.
+    
+    Paging is opt-in: without limit and cursor the whole result is
+    returned, as clients written before pagination expect. A cursor
+    without limit pages by PAGE_SIZE.
+    """
+
+    def __init__(
+        self,
+        limit: Optional[int] = Query(None, ge=1, le=settings.MAX_PAGE_SIZE),
+        cursor: Optional[str] = Query(None)
+    ):
+        self.limit = limit
+        self.after = decode_cursor(cursor) if cursor else None
+
+def paginate(
+    db,
+    collection: str,
+    query: dict,
+    page: PageParams,
+    response: Response,
+    sort: Tuple[str, int] = DEFAULT_SORT,
+    projection: List[str] = None
+) -> List[dict]:
+    """Find one page of documents and set the next-cursor header if more remain"""
+    limit = page.limit
+    if limit is None:
+        if page.after is None:
+            return db.find(collection, query, sort=sort, projection=projection)
+        limit = settings.PAGE_SIZE
+    if projection is not None:
+        # The cursor is built from the sort field and id of the last item
+        projection = list(dict.fromkeys([*projection, sort[0], "id"]))
+    items = db.find(
+        collection, query, sort=sort, limit=limit + 1, after=page.after, projection=projection
+    )
+    if len(items) > limit:
+        items = items[:limit]
+        last = items[-1]
+        response.headers[NEXT_CURSOR_HEADER] = encode_cursor([last.get(sort[0]), last.get("id")])
+    return items
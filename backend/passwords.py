@@ -0,0 +1,144 @@
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Callable, List, Optional, Tuple
+import bcrypt
+from passlib.context import CryptContext
+from config import settings
+
+def _bcrypt_hash(password: str, rounds: int) -> str:
+    """Hash in a worker process; same $2b$ format passlib produces"""
+    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds)).decode("ascii")
+
+class PasswordHasher:
+    """bcrypt hashing off the event loop with bounded concurrency.
+    
+    Every hash or verify, async or not, holds one slot of a semaphore
+    sized max_concurrency. Async callers wait in a thread pool of the same
+    size, so the event loop never runs bcrypt. bcrypt releases the GIL,
+    so threads hash in parallel. Bulk hashing (hash_many) goes to a
+    process pool instead, created on first use.
+    
+    Hashes made with a cost other than rounds verify normally and come
+    back from verify with a replacement hash at the current cost.
+    """
+    
+    def __init__(self, rounds: int, max_concurrency: int):
+        self.rounds = rounds
+        self.context = CryptContext(
+            schemes=["bcrypt"],
+            deprecated="auto",
+            bcrypt__default_rounds=rounds,
+            bcrypt__min_rounds=rounds,
+            bcrypt__max_rounds=rounds
+        )
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix="bcrypt")
+        self._processes: Optional[ProcessPoolExecutor] = None
+        self._stats_lock = threading.Lock()
+        self.max_concurrency = max_concurrency
+        self.operations = 0
+        self.rehashes = 0
+        self.waiting = 0
+        self.wait_seconds = 0.0
+        self.max_wait_seconds = 0.0
+        self.hash_seconds = 0.0
+    
+    def _enqueue(self) -> float:
+        with self._stats_lock:
+            self.waiting += 1
+        return time.perf_counter()
+    
+    def _run(self, queued: float, operation: Callable, *args):
+        """Run operation in one concurrency slot, recording wait (since queued) and hash time"""
+        with self._slots:
+            started = time.perf_counter()
+            with self._stats_lock:
+                self.waiting -= 1
+            try:
+                return operation(*args)
+            finally:
+                finished = time.perf_counter()
+                with self._stats_lock:
+                    self.operations += 1
+                    self.wait_seconds += started - queued
+                    self.max_wait_seconds = max(self.max_wait_seconds, started - queued)
+                    self.hash_seconds += finished - started
+    
+    def _verify(self, password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+        try:
+            valid, new_hash = self.context.verify_and_update(password, hashed)
+        except ValueError:
+            # Empty or malformed stored hash
+            return False, None
+        if new_hash is not None:
+            with self._stats_lock:
+                self.rehashes += 1
+        return valid, new_hash
+    
+    def hash_sync(self, password: str) -> str:
+        """Hash password in the calling thread (for sync code)"""
+        return self._run(self._enqueue(), self.context.hash, password)
+    
+    def verify_sync(self, password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+        """Check password, returning (valid, new hash if the cost changed)"""
+        return self._run(self._enqueue(), self._verify, password, hashed)
+    
+    async def hash(self, password: str) -> str:
+        """Hash password without blocking the event loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, self._run, self._enqueue(), self.context.hash, password
+        )
+    
+    async def verify(self, password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+        """Async verify_sync"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self._executor, self._run, self._enqueue(), self._verify, password, hashed
+        )
+    
+    def hash_many(self, passwords: List[str]) -> List[str]:
+        """Hash many passwords in parallel across worker processes"""
+        if not passwords:
+            return []
+        with self._stats_lock:
+            if self._processes is None:
+                # Not fork: the children would inherit locks other threads of
+                # this worker held at that moment
+                self._processes = ProcessPoolExecutor(
+                    max_workers=settings.PASSWORD_IMPORT_WORKERS or os.cpu_count(),
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+        started = time.perf_counter()
+        hashes = list(self._processes.map(_bcrypt_hash, passwords, [self.rounds] * len(passwords), chunksize=8))
+        with self._stats_lock:
+            self.operations += len(passwords)
+            self.hash_seconds += time.perf_counter() - started
+        return hashes
+    
+    def close(self):
+        """Stop worker threads and processes"""
+        self._executor.shutdown(wait=False)
+        if self._processes is not None:
+            self._processes.shutdown(wait=False)
+    
+    def stats(self) -> dict:
+        """Get operation counts and average queue wait / hash time"""
+        with self._stats_lock:
+            done = self.operations
+            return {
+                "rounds": self.rounds,
+                "max_concurrency": self.max_concurrency,
+                "operations": done,
+                "rehashes": self.rehashes,
+                "waiting": self.waiting,
+                "avg_wait_ms": round(self.wait_seconds / done * 1000, 2) if done else 0.0,
+                "max_wait_ms": round(self.max_wait_seconds * 1000, 2),
+                "avg_hash_ms": round(self.hash_seconds / done * 1000, 2) if done else 0.0
+            }
+
+password_hasher = PasswordHasher(settings.BCRYPT_ROUNDS, settings.PASSWORD_HASH_CONCURRENCY)
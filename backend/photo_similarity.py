@@ -0,0 +1,271 @@
+"""Server-side photo verification for attendance check-ins.
+
+A feature extractor turns photo bytes into a vector on the CPU. It is
+chosen by PHOTO_FEATURE_EXTRACTOR: "thumbnail" (needs Pillow), "histogram",
+or "module:function" for any callable taking bytes and returning a 1-D
+array. If the configured extractor is unavailable, scoring is disabled
+and check-ins keep similarity / photo_verified unset.
+
+Students' reference vectors live in the photo_references collection,
+and each group's references are cached as one L2-normalized NumPy
+matrix.
+
+Check-ins with a photo are queued and scored in the background:
+requests collected within PHOTO_SCORING_BATCH_MS are featurized on a
+thread pool, then each group's batch is scored against its matrix with a
+single matrix product. The scores are written back with one bulk_write.
+"""
+import importlib
+import queue
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+from typing import Callable, Dict, List, Optional, Tuple
+import numpy as np
+from config import settings
+from blobs import blob_store
+from database import get_db
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+REFERENCES = "photo_references"
+
+Extractor = Callable[[bytes], np.ndarray]
+
+def histogram_features(data: bytes) -> np.ndarray:
+    """Byte-value histogram of the file; needs no image decoder, but only
+    matches near-identical files"""
+    counts = np.bincount(np.frombuffer(data, dtype=np.uint8), minlength=256).astype(np.float32)
+    return counts - counts.mean()
+
+def thumbnail_features(data: bytes, size: int = 32) -> np.ndarray:
+    """Mean-centered grayscale thumbnail"""
+    with Image.open(BytesIO(data)) as image:
+        pixels = np.asarray(image.convert("L").resize((size, size)), dtype=np.float32).ravel()
+    return pixels - pixels.mean()
+
+EXTRACTORS: Dict[str, Extractor] = {
+    "thumbnail": thumbnail_features,
+    "histogram": histogram_features
+}
+
+def get_extractor(name: str) -> Tuple[str, Optional[Extractor]]:
+    """Get (name, extractor); the extractor is None when Pillow is missing"""
+    if ":" in name:
+        module, _, attr = name.partition(":")
+        return name, getattr(importlib.import_module(module), attr)
+    if name not in EXTRACTORS:
+        raise ValueError(f"Unknown photo feature extractor: {name} (choose from {', '.join(EXTRACTORS)} or module:function)")
+    if name == "thumbnail" and Image is None:
+        print("⚠️  Pillow o'rnatilmagan, rasmlar tekshirilmaydi")
+        return name, None
+    return name, EXTRACTORS[name]
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    """Scale rows to unit length (zero rows stay zero)"""
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+def score_batch(queries: np.ndarray, claimed: np.ndarray, references: np.ndarray, owners: np.ndarray) -> np.ndarray:
+    """Best cosine similarity of each query row to the references of its claimed owner.
+    
+    queries is (m, d) and references (n, d), both normalized; claimed (m,)
+    and owners (n,) are integer owner codes. Queries whose owner has no
+    reference get NaN.
+    """
+    if not len(references):
+        return np.full(len(queries), np.nan, dtype=np.float32)
+    similarities = queries @ references.T
+    mask = claimed[:, None] == owners[None, :]
+    best = np.where(mask, similarities, -np.inf).max(axis=1)
+    best[~mask.any(axis=1)] = np.nan
+    return best
+
+class SimilarityEngine:
+    """Batches check-in photos and scores them against group reference matrices"""
+    
+    def __init__(self, extractor: str, workers: int, batch_ms: int, threshold: float):
+        self.extractor_name, self.extractor = get_extractor(extractor)
+        self.threshold = threshold
+        self.batch_seconds = batch_ms / 1000
+        self.workers = workers
+        self._queue: "queue.Queue[Optional[dict]]" = queue.Queue()
+        self._pool: Optional[ThreadPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        # group id -> (student ids, references version, generation, matrix, owner codes, id -> code)
+        self._groups: Dict[str, tuple] = {}
+        self._generation = 0
+        self.batches = 0
+        self.scored = 0
+        self.failed = 0
+    
+    @property
+    def available(self) -> bool:
+        return self.extractor is not None
+    
+    def features(self, photo_key: str) -> np.ndarray:
+        """Read a blob and extract its feature vector"""
+        if not self.available:
+            raise RuntimeError(f"Photo feature extractor {self.extractor_name} is unavailable")
+        with open(blob_store.path(photo_key), "rb") as f:
+            return np.asarray(self.extractor(f.read()), dtype=np.float32).ravel()
+    
+    def _try_features(self, photo_key: str) -> Optional[np.ndarray]:
+        try:
+            return self.features(photo_key)
+        except Exception as e:
+            print(f"Photo {photo_key}: {e}")
+            return None
+    
+    def enroll(self, db, student_id: str, photo_key: str) -> dict:
+        """Store photo_key as a reference photo of student"""
+        vector = self.features(photo_key)
+        reference = db.insert_one(REFERENCES, {
+            "student_id": student_id,
+            "photo_key": photo_key,
+            "extractor": self.extractor_name,
+            "vector": vector.tolist()
+        })
+        with self._lock:
+            self._generation += 1
+        return reference
+    
+    def _references(self, db, group: dict) -> tuple:
+        """Get the cached (matrix, owner codes, id -> code) of group's references"""
+        student_ids = tuple(group.get("student_ids", []))
+        version = db.collection_version(REFERENCES)
+        with self._lock:
+            generation = self._generation
+            cached = self._groups.get(group["id"])
+        if cached is not None and cached[0] == student_ids and cached[1] is version and cached[2] == generation:
+            return cached[3:]
+        codes = {student_id: code for code, student_id in enumerate(student_ids)}
+        references = db.find(
+            REFERENCES,
+            {"student_id": {"$in": list(student_ids)}, "extractor": self.extractor_name},
+            projection=["student_id", "vector"]
+        )
+        if references:
+            matrix = normalize(np.array([r["vector"] for r in references], dtype=np.float32))
+        else:
+            matrix = np.zeros((0, 0), dtype=np.float32)
+        owners = np.array([codes[r["student_id"]] for r in references], dtype=np.int64)
+        with self._lock:
+            self._groups[group["id"]] = (student_ids, version, generation, matrix, owners, codes)
+        return matrix, owners, codes
+    
+    def _executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="photo-features")
+            return self._pool
+    
+    def submit(self, attendance: dict):
+        """Queue a check-in with a photo_key for scoring, without waiting"""
+        if not self.available:
+            # Better no verdict than one from a weaker extractor
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="photo-scoring", daemon=True)
+                self._thread.start()
+        self._queue.put(attendance)
+    
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            # Let the rest of the lesson's check-ins arrive
+            deadline = time.monotonic() + self.batch_seconds
+            batch = [item]
+            while True:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=max(remaining, 0)) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._queue.put(None)
+                    break
+                batch.append(item)
+            try:
+                self.score(get_db(), batch)
+            except Exception as e:
+                self.failed += len(batch)
+                print(f"Photo scoring failed: {e}")
+    
+    def score(self, db, attendances: List[dict]) -> Dict[str, Optional[float]]:
+        """Score check-ins and store similarity / photo_verified, returning id -> score"""
+        vectors = list(self._executor().map(self._try_features, [a["photo_key"] for a in attendances]))
+        scores: Dict[str, Optional[float]] = {}
+        by_group: Dict[str, List[int]] = defaultdict(list)
+        for i, attendance in enumerate(attendances):
+            if vectors[i] is None:
+                scores[attendance["id"]] = None
+            else:
+                by_group[attendance["group_id"]].append(i)
+        groups = {g["id"]: g for g in db.find("groups", {"id": {"$in": list(by_group)}})}
+        
+        for group_id, positions in by_group.items():
+            if group_id not in groups:
+                scores.update((attendances[i]["id"], None) for i in positions)
+                continue
+            matrix, owners, codes = self._references(db, groups[group_id])
+            queries = normalize(np.stack([vectors[i] for i in positions]))
+            claimed = np.array([codes.get(attendances[i]["student_id"], -1) for i in positions], dtype=np.int64)
+            if len(matrix) and matrix.shape[1] != queries.shape[1]:
+                # References of another vector size cannot be compared
+                matrix, owners = matrix[:0], owners[:0]
+            best = score_batch(queries, claimed, matrix, owners)
+            scores.update(
+                (attendances[i]["id"], None if np.isnan(score) else round(float(score), 4))
+                for i, score in zip(positions, best)
+            )
+        
+        db.bulk_write("attendances", updates=[
+            ({"id": attendance_id}, {
+                "similarity": score,
+                "photo_verified": None if score is None else score >= self.threshold
+            })
+            for attendance_id, score in scores.items()
+        ])
+        self.batches += 1
+        self.scored += len(attendances)
+        return scores
+    
+    def close(self):
+        """Score what is queued, then stop the scoring thread and feature workers"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join(timeout=5)
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False)
+    
+    def stats(self) -> dict:
+        return {
+            "extractor": self.extractor_name,
+            "available": self.available,
+            "queued": self._queue.qsize(),
+            "batches": self.batches,
+            "scored": self.scored,
+            "failed": self.failed,
+            "cached_groups": len(self._groups)
+        }
+
+similarity_engine = SimilarityEngine(
+    settings.PHOTO_FEATURE_EXTRACTOR,
+    settings.PHOTO_SCORING_WORKERS,
+    settings.PHOTO_SCORING_BATCH_MS,
+    settings.PHOTO_MATCH_THRESHOLD
+)
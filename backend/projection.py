@@ -0,0 +1,45 @@
+from functools import lru_cache
+from typing import List, Optional, Tuple, Type
+from fastapi import HTTPException, Response, status
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel, create_model
+from pagination import NEXT_CURSOR_HEADER
+
+def parse_fields(fields: Optional[str], model: Type[BaseModel]) -> Optional[List[str]]:
+    """Validate ?fields= against the response model, None means all fields"""
+    if not fields:
+        return None
+    names = [name.strip() for name in fields.split(",") if name.strip()]
+    unknown = [name for name in names if name not in model.model_fields]
+    if unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown fields: {', '.join(unknown)}"
+        )
+    if "id" in model.model_fields and "id" not in names:
+        names.insert(0, "id")
+    return names
+
+@lru_cache(maxsize=256)
+def partial_model(model: Type[BaseModel], fields: Tuple[str, ...]) -> Type[BaseModel]:
+    """Get a model with only the given fields of model, all optional"""
+    return create_model(
+        f"{model.__name__}Fields",
+        **{name: (Optional[model.model_fields[name].annotation], None) for name in fields}
+    )
+
+def projected_response(
+    items: List[dict],
+    model: Type[BaseModel],
+    fields: List[str],
+    response: Response
+) -> JSONResponse:
+    """Serialize projected documents through the trimmed response model"""
+    trimmed = partial_model(model, tuple(fields))
+    headers = {}
+    if NEXT_CURSOR_HEADER in response.headers:
+        headers[NEXT_CURSOR_HEADER] = response.headers[NEXT_CURSOR_HEADER]
+    return JSONResponse(
+        [trimmed.model_validate(item).model_dump(mode="json") for item in items],
+        headers=headers
+    )
@@ -0,0 +1,211 @@
+"""Mongo-style query support for JSONDatabase.
+
+A query is compiled once into a predicate over documents, and can also
+produce an index plan: the set of primary keys that may match, built
+from hash index lookups instead of a full scan.
+
+Supported syntax:
+    {"field": value}                   equality, or array contains value
+    {"field": {"$eq": value}}          same as above
+    {"field": {"$ne": value}}
+    {"field": {"$in": [v1, v2]}}       value (or any array element) in list
+    {"field": {"$gt": v, "$lte": v}}   ranges ($gt, $gte, $lt, $lte)
+    {"field": {"$exists": True}}
+    {"$or": [query, ...]}, {"$and": [query, ...]}
+
+Updates set plain fields as they are, plus operators that are resolved
+against the stored document inside the write (see apply_update):
+    {"$addToSet": {"field": value}}    or {"field": {"$each": [v1, v2]}}
+    {"$pull": {"field": value}}        or {"field": {"$in": [v1, v2]}}
+    {"$max": {"field": value}}         set only if greater than the stored value
+    {"$setOnInsert": {"field": value}} set only when an upsert inserts
+
+Results are sorted with sort_key, which gives mixed-type values a total
+order: missing/None, booleans, numbers, strings, then everything else.
+"""
+import json
+import operator
+from typing import Any, Callable, Iterable, Optional, Set
+
+_MISSING = object()
+
+Predicate = Callable[[dict], bool]
+
+# Returns keys of documents whose field holds value, or None if field is not indexed
+Lookup = Callable[[str, Any], Optional[Iterable[Any]]]
+
+_RANGE_OPERATORS = {
+    "$gt": operator.gt,
+    "$gte": operator.ge,
+    "$lt": operator.lt,
+    "$lte": operator.le
+}
+
+def is_hashable(value: Any) -> bool:
+    return not isinstance(value, (list, dict))
+
+def sort_key(value: Any) -> tuple:
+    """Get a comparable key for value, usable across types"""
+    if value is None:
+        return (0,)
+    if isinstance(value, bool):
+        return (1, value)
+    if isinstance(value, (int, float)):
+        return (2, value)
+    if isinstance(value, str):
+        return (3, value)
+    return (4, json.dumps(value, sort_keys=True, default=str))
+
+_UPDATE_OPERATORS = {"$addToSet", "$pull", "$max", "$setOnInsert"}
+
+def apply_update(doc: dict, update: dict, inserting: bool = False) -> dict:
+    """Resolve update against doc into the plain fields to set"""
+    unknown = {key for key in update if key.startswith("$")} - _UPDATE_OPERATORS
+    if unknown:
+        raise ValueError(f"Unsupported update operator: {', '.join(sorted(unknown))}")
+    fields = {key: value for key, value in update.items() if not key.startswith("$")}
+    for field, value in update.get("$addToSet", {}).items():
+        values = value["$each"] if isinstance(value, dict) and "$each" in value else [value]
+        current = list(doc.get(field) or [])
+        for item in values:
+            if item not in current:
+                current.append(item)
+        fields[field] = current
+    for field, value in update.get("$pull", {}).items():
+        values = value["$in"] if isinstance(value, dict) and "$in" in value else [value]
+        fields[field] = [item for item in doc.get(field) or [] if item not in values]
+    for field, value in update.get("$max", {}).items():
+        if doc.get(field) is None or sort_key(value) > sort_key(doc[field]):
+            fields[field] = value
+    if inserting:
+        fields.update(update.get("$setOnInsert", {}))
+    return fields
+
+def project(doc: dict, fields: Iterable[str]) -> dict:
+    """Copy only fields of doc (those present)"""
+    return {field: doc[field] for field in fields if field in doc}
+
+def _is_operator_dict(value: Any) -> bool:
+    return isinstance(value, dict) and bool(value) and all(key.startswith("$") for key in value)
+
+def _equals(actual: Any, expected: Any) -> bool:
+    if actual == expected:
+        return True
+    return isinstance(actual, list) and not isinstance(expected, list) and expected in actual
+
+def _compile_condition(op: str, expected: Any) -> Callable[[Any], bool]:
+    """Compile one operator into a check on the field value (_MISSING if absent)"""
+    if op == "$eq":
+        return lambda actual: actual is not _MISSING and _equals(actual, expected)
+    if op == "$ne":
+        return lambda actual: actual is _MISSING or not _equals(actual, expected)
+    if op == "$in":
+        if not isinstance(expected, (list, tuple, set)):
+            raise ValueError("$in requires a list")
+        hashable = [value for value in expected if is_hashable(value)]
+        unhashable = [value for value in expected if not is_hashable(value)]
+        expected_set = set(hashable)
+        
+        def check_in(actual):
+            if actual is _MISSING:
+                return False
+            candidates = actual if isinstance(actual, list) else [actual]
+            for value in candidates:
+                if is_hashable(value) and value in expected_set:
+                    return True
+            return actual in unhashable
+        return check_in
+    if op == "$exists":
+        return lambda actual: (actual is not _MISSING) == bool(expected)
+    if op in _RANGE_OPERATORS:
+        compare = _RANGE_OPERATORS[op]
+        
+        def check_range(actual):
+            if actual is _MISSING or actual is None:
+                return False
+            try:
+                return compare(actual, expected)
+            except TypeError:
+                return False
+        return check_range
+    raise ValueError(f"Unsupported query operator: {op}")
+
+def _compile_field(field: str, expected: Any) -> Predicate:
+    if _is_operator_dict(expected):
+        checks = [_compile_condition(op, value) for op, value in expected.items()]
+    else:
+        checks = [_compile_condition("$eq", expected)]
+    
+    if len(checks) == 1:
+        check = checks[0]
+        return lambda doc: check(doc.get(field, _MISSING))
+    return lambda doc: all(check(doc.get(field, _MISSING)) for check in checks)
+
+def compile_query(query: Optional[dict]) -> Predicate:
+    """Compile query into a predicate over documents"""
+    if not query:
+        return lambda doc: True
+    
+    predicates = []
+    for key, value in query.items():
+        if key == "$or":
+            branches = [compile_query(branch) for branch in value]
+            predicates.append(lambda doc, branches=branches: any(branch(doc) for branch in branches))
+        elif key == "$and":
+            branches = [compile_query(branch) for branch in value]
+            predicates.append(lambda doc, branches=branches: all(branch(doc) for branch in branches))
+        elif key.startswith("$"):
+            raise ValueError(f"Unsupported query operator: {key}")
+        else:
+            predicates.append(_compile_field(key, value))
+    
+    if len(predicates) == 1:
+        return predicates[0]
+    return lambda doc: all(predicate(doc) for predicate in predicates)
+
+def _lookup_all(lookup: Lookup, field: str, values: Iterable[Any]) -> Optional[Set[Any]]:
+    """Union of index lookups for several values, None if any is not answerable"""
+    keys = set()
+    for value in values:
+        if not is_hashable(value):
+            return None
+        found = lookup(field, value)
+        if found is None:
+            return None
+        keys.update(found)
+    return keys
+
+def plan_query(query: Optional[dict], lookup: Lookup) -> Optional[Set[Any]]:
+    """Get candidate keys for query from indexes.
+    
+    The result is a superset of the matching keys and still has to be
+    filtered with the compiled predicate. None means a full scan is needed.
+    """
+    if not query:
+        return None
+    
+    best = None
+    for key, value in query.items():
+        candidates = None
+        if key == "$or":
+            branches = [plan_query(branch, lookup) for branch in value]
+            if branches and all(branch is not None for branch in branches):
+                candidates = set().union(*branches)
+        elif key == "$and":
+            for branch in value:
+                planned = plan_query(branch, lookup)
+                if planned is not None:
+                    candidates = planned if candidates is None else candidates & planned
+        elif _is_operator_dict(value):
+            if "$eq" in value:
+                candidates = _lookup_all(lookup, key, [value["$eq"]])
+            elif "$in" in value:
+                candidates = _lookup_all(lookup, key, value["$in"])
+        else:
+            candidates = _lookup_all(lookup, key, [value])
+        
+        if candidates is not None:
+            best = candidates if best is None else best & candidates
+            if not best:
+                break
+    return best
@@ -0,0 +1,97 @@
+"""In-process pub/sub hub behind the /ws endpoint.
+
+Each WebSocket connection has a bounded outgoing queue drained by its
+own sender task. publish() can be called from any thread (sync routes
+run in the threadpool); events are handed to the event loop with
+call_soon_threadsafe. A client whose queue is full is disconnected
+rather than buffered without limit, and reconnects to refetch state.
+"""
+import asyncio
+import threading
+from typing import Dict, Set
+from fastapi import WebSocket
+from config import settings
+
+# Close code for slow consumers ("try again later")
+CLOSE_TRY_AGAIN = 1013
+
+class Connection:
+    """One authenticated WebSocket and its outgoing queue"""
+    
+    def __init__(self, websocket: WebSocket, user_id: str):
+        self.websocket = websocket
+        self.user_id = user_id
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=settings.WS_QUEUE_SIZE)
+        self.loop = asyncio.get_running_loop()
+        self.closed = asyncio.Event()
+    
+    def enqueue(self, event: dict) -> bool:
+        """Queue event for sending (on the loop thread), False if the queue is full"""
+        if self.closed.is_set():
+            return True
+        try:
+            self.queue.put_nowait(event)
+            return True
+        except asyncio.QueueFull:
+            return False
+    
+    async def sender(self, hub: "Hub"):
+        """Send queued events until the connection closes"""
+        try:
+            while True:
+                event = await self.queue.get()
+                await self.websocket.send_json(event)
+        except Exception:
+            pass
+        finally:
+            self.closed.set()
+            hub.disconnect(self)
+
+class Hub:
+    """Routes events to the connections of a user"""
+    
+    def __init__(self):
+        self._connections: Dict[str, Set[Connection]] = {}
+        self._lock = threading.Lock()
+        self.published = 0
+        self.dropped = 0
+    
+    def connect(self, connection: Connection):
+        with self._lock:
+            self._connections.setdefault(connection.user_id, set()).add(connection)
+    
+    def disconnect(self, connection: Connection):
+        with self._lock:
+            connections = self._connections.get(connection.user_id)
+            if connections is not None:
+                connections.discard(connection)
+                if not connections:
+                    del self._connections[connection.user_id]
+    
+    def publish(self, user_id: str, event: dict):
+        """Push event to every connection of user_id, from any thread"""
+        with self._lock:
+            connections = list(self._connections.get(user_id, ()))
+            self.published += len(connections)
+        for connection in connections:
+            connection.loop.call_soon_threadsafe(self._deliver, connection, event)
+    
+    def _deliver(self, connection: Connection, event: dict):
+        if not connection.enqueue(event):
+            # Slow consumer: drop it instead of buffering without bound
+            self.dropped += 1
+            connection.closed.set()
+            asyncio.ensure_future(connection.websocket.close(code=CLOSE_TRY_AGAIN))
+            self.disconnect(connection)
+    
+    def stats(self) -> dict:
+        """Get connection counts"""
+        with self._lock:
+            return {
+                "connections": sum(len(connections) for connections in self._connections.values()),
+                "users": len(self._connections),
+                "published": self.published,
+                "dropped": self.dropped
+            }
+
+hub = Hub()
@@ -1,7 +1,8 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from database import JSONDatabase
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
+from database import get_db
+from pagination import PageParams, paginate
 from models.attendance import AttendanceResponse, AttendanceCreate
-from routes.users import get_current_user
+from security import get_current_user
 from datetime import datetime
 from typing import List, Optional
 
@@ -9,20 +10,21 @@ router = APIRouter(tags=["attendance"])
 
 @router.get("", response_model=List[AttendanceResponse])
 def get_attendance(
+    response: Response,
     studentId: Optional[str] = Query(None),
     date: Optional[str] = Query(None),
-    current_user = Depends(get_current_user)
+    page: PageParams = Depends(),
+    current_user = Depends(get_current_user),
+    db = Depends(get_db)
 ):
     """Get attendance records"""
-    db = JSONDatabase()
-    
     query = {}
     if studentId:
         query["studentId"] = studentId
     if date:
         query["date"] = date
     
-    records = db.find("attendance", query)
+    records = paginate(db, "attendance", query, page, response)
     
     return [
         AttendanceResponse(
@@ -40,11 +42,10 @@ def get_attendance(
 @router.post("", response_model=AttendanceResponse)
 def record_attendance(
     attendance_data: AttendanceCreate,
-    current_user = Depends(get_current_user)
+    current_user = Depends(get_current_user),
+    db = Depends(get_db)
 ):
     """Record attendance"""
-    db = JSONDatabase()
-    
     attendance_dict = {
         "studentId": attendance_data.studentId,
         "date": attendance_data.date,
@@ -69,11 +70,10 @@ def record_attendance(
 @router.delete("/{attendance_id}")
 def delete_attendance(
     attendance_id: str,
-    current_user = Depends(get_current_user)
+    current_user = Depends(get_current_user),
+    db = Depends(get_db)
 ):
     """Delete attendance record"""
-    db = JSONDatabase()
-    
     record = db.find_one("attendance", {"id": attendance_id})
     if not record:
         raise HTTPException(
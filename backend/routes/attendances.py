@@ -1,23 +1,39 @@
-from fastapi import APIRouter, HTTPException, Depends
-from typing import List
-from models.attendance import AttendanceCreate, AttendanceUpdate, Attendance
-from database import JSONDatabase
+from fastapi import APIRouter, HTTPException, Depends, File, Query, Request, Response, UploadFile
+from typing import List, Optional
+from models.attendance import (
+    AttendanceBulkResult, AttendanceBulkUpdate, AttendanceCreate, AttendanceUpdate, Attendance, AttendanceStats,
+    PhotoReference, PhotoReferenceCreate, PhotoUpload
+)
+from database import get_db
+from pagination import PageParams, paginate
+from projection import parse_fields, projected_response
 from security import get_current_user
+from messaging import post_message
+from attendance_stats import attendance_rollups
+from blobs import BlobTooLarge, blob_store, serve_blob, sniff_image
+from config import settings
+from photo_similarity import similarity_engine
 from datetime import datetime
 
 router = APIRouter()
-db = JSONDatabase()
 
 @router.post("", response_model=Attendance)
-def create_attendance_request(attendance: AttendanceCreate, current_user: dict = Depends(get_current_user)):
+def create_attendance_request(attendance: AttendanceCreate, current_user: dict = Depends(get_current_user), db = Depends(get_db)):
     if current_user["role"] != "student":
         raise HTTPException(status_code=403, detail="Only students can mark attendance")
+    if attendance.photo_key and not blob_store.exists(attendance.photo_key):
+        raise HTTPException(status_code=400, detail="Unknown photo_key, upload the photo first")
     
     attendance_dict = attendance.model_dump()
     attendance_dict["created_at"] = datetime.now().isoformat()
     attendance_dict["updated_at"] = datetime.now().isoformat()
     
-    result = db.insert_one("attendances", attendance_dict)
+    with attendance_rollups.lock:
+        result = db.insert_one("attendances", attendance_dict)
+        attendance_rollups.inserted(db, [result])
+    if result.get("photo_key"):
+        # Scored in the background; similarity / photo_verified are filled in later
+        similarity_engine.submit(result)
     
     group = db.find_one("groups", {"id": attendance.group_id})
     if group:
@@ -29,36 +45,146 @@ def create_attendance_request(attendance: AttendanceCreate, current_user: dict =
             message_type="attendance_request"
         )
         
-        message_dict = message.model_dump()
-        message_dict["is_read"] = False
-        message_dict["created_at"] = datetime.now().isoformat()
-        db.insert_one("messages", message_dict)
+        post_message(db, message.model_dump(), "attendance_request", attendance=result)
     
     return result
 
+@router.post("/photos", response_model=PhotoUpload)
+def upload_photo(file: UploadFile = File(...), current_user: dict = Depends(get_current_user)):
+    """Store a check-in photo, returning the key to send as photo_key"""
+    content_type = sniff_image(file.file.read(16))
+    file.file.seek(0)
+    if content_type is None:
+        raise HTTPException(status_code=400, detail="Photo must be a JPEG, PNG, GIF or WebP image")
+    try:
+        key, size = blob_store.put_stream(file.file, settings.PHOTO_MAX_BYTES)
+    except BlobTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    return {"key": key, "size": size, "content_type": content_type}
+
+@router.post("/references", response_model=PhotoReference)
+def add_photo_reference(reference: PhotoReferenceCreate, current_user: dict = Depends(get_current_user), db = Depends(get_db)):
+    """Register an uploaded photo as a reference photo of a student"""
+    if current_user["role"] == "teacher":
+        if not db.find_one("groups", {"teacher_id": current_user["id"], "student_ids": reference.student_id}):
+            raise HTTPException(status_code=403, detail="Student is not in your groups")
+    elif current_user["role"] not in ["super_admin", "school_admin"]:
+        raise HTTPException(status_code=403, detail="Only teachers and admins can add reference photos")
+    if not blob_store.exists(reference.photo_key):
+        raise HTTPException(status_code=400, detail="Unknown photo_key, upload the photo first")
+    if not similarity_engine.available:
+        raise HTTPException(status_code=503, detail="Photo verification is not available on this server")
+    try:
+        return similarity_engine.enroll(db, reference.student_id, reference.photo_key)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Cannot read photo: {e}")
+
+@router.get("/photos/{key}")
+def download_photo(key: str, request: Request, current_user: dict = Depends(get_current_user)):
+    return serve_blob(blob_store, key, request)
+
 @router.put("/{attendance_id}", response_model=Attendance)
-def update_attendance(attendance_id: str, update: AttendanceUpdate, current_user: dict = Depends(get_current_user)):
+def update_attendance(attendance_id: str, update: AttendanceUpdate, current_user: dict = Depends(get_current_user), db = Depends(get_db)):
     if current_user["role"] != "teacher":
         raise HTTPException(status_code=403, detail="Only teachers can approve attendance")
     
-    attendance = db.find_one("attendances", {"id": attendance_id})
-    if not attendance:
-        raise HTTPException(status_code=404, detail="Attendance not found")
-    
     update_data = {k: v for k, v in update.model_dump(exclude_unset=True).items()}
     update_data["updated_at"] = datetime.now().isoformat()
     
-    updated_attendance = db.update_one("attendances", {"id": attendance_id}, update_data)
+    with attendance_rollups.lock:
+        attendance = db.find_one("attendances", {"id": attendance_id})
+        if not attendance:
+            raise HTTPException(status_code=404, detail="Attendance not found")
+        updated_attendance = db.update_one("attendances", {"id": attendance_id}, update_data)
+        attendance_rollups.changed(db, [updated_attendance], {attendance_id: attendance.get("status")})
     return updated_attendance
 
+@router.post("/bulk", response_model=AttendanceBulkResult)
+def bulk_update_attendance(request: AttendanceBulkUpdate, current_user: dict = Depends(get_current_user), db = Depends(get_db)):
+    """Approve or reject pending check-ins and mark students who did not check in absent"""
+    if current_user["role"] != "teacher":
+        raise HTTPException(status_code=403, detail="Only teachers can approve attendance")
+    
+    lesson_fields = (request.group_id, request.lesson_date, request.lesson_time)
+    if request.ids:
+        selected = db.find("attendances", {"id": {"$in": request.ids}})
+        lessons = {(a["group_id"], a["lesson_date"], a["lesson_time"]) for a in selected}
+    elif all(lesson_fields):
+        selected = None
+        lessons = {lesson_fields}
+    else:
+        raise HTTPException(status_code=400, detail="Give ids, or group_id, lesson_date and lesson_time")
+    
+    group_ids = list({group_id for group_id, _, _ in lessons})
+    groups = {g["id"]: g for g in db.find("groups", {"id": {"$in": group_ids}})}
+    if any(groups.get(group_id, {}).get("teacher_id") != current_user["id"] for group_id in group_ids):
+        raise HTTPException(status_code=403, detail="Not your group")
+    
+    now = datetime.now().isoformat()
+    # Absentees are upserted on (lesson, student) and only inserted inside the
+    # write, so a student whose check-in lands first is never marked absent
+    absent = [
+        {"group_id": group_id, "lesson_date": lesson_date, "lesson_time": lesson_time, "student_id": student_id,
+         "$setOnInsert": {"check_in_time": None, "status": "absent", "created_at": now, "updated_at": now}}
+        for group_id, lesson_date, lesson_time in sorted(lessons)
+        for student_id in groups[group_id].get("student_ids", [])
+    ]
+    
+    if selected is None:
+        pending = {**dict(zip(("group_id", "lesson_date", "lesson_time"), lesson_fields)), "status": "pending"}
+    else:
+        pending = {"id": {"$in": [a["id"] for a in selected]}, "status": "pending"}
+    # Decisions and absentees go to storage as one write
+    with attendance_rollups.lock:
+        updated, inserted = db.bulk_write(
+            "attendances",
+            updates=[(pending, {"status": request.status, "updated_at": now})],
+            upserts=absent,
+            upsert_key=("group_id", "lesson_date", "lesson_time", "student_id")
+        )
+        attendance_rollups.changed(db, updated, {a["id"]: "pending" for a in updated})
+        attendance_rollups.inserted(db, inserted)
+    return {
+        "status": request.status,
+        "updated": len(updated),
+        "absent_student_ids": [a["student_id"] for a in inserted]
+    }
+
+@router.get("/stats", response_model=AttendanceStats)
+def get_attendance_stats(
+    group_id: Optional[str] = Query(None),
+    current_user: dict = Depends(get_current_user),
+    db = Depends(get_db)
+):
+    """Present/absent/pending rates per group, student and month the user may see"""
+    student_id = None
+    group_ids = None
+    if current_user["role"] == "student":
+        student_id = current_user["id"]
+    elif current_user["role"] == "teacher":
+        group_ids = {g["id"] for g in db.find("groups", {"teacher_id": current_user["id"]}, projection=["id"])}
+    if group_id is not None:
+        group_ids = {group_id} if group_ids is None else group_ids & {group_id}
+    return attendance_rollups.rates(db, group_ids, student_id)
+
 @router.get("", response_model=List[Attendance])
-def get_attendances(current_user: dict = Depends(get_current_user)):
+def get_attendances(
+    response: Response,
+    page: PageParams = Depends(),
+    fields: Optional[str] = Query(None),
+    current_user: dict = Depends(get_current_user),
+    db = Depends(get_db)
+):
+    projection = parse_fields(fields, Attendance)
     if current_user["role"] == "student":
-        attendances = db.find("attendances", {"student_id": current_user["id"]})
+        query = {"student_id": current_user["id"]}
     elif current_user["role"] == "teacher":
         groups = db.find("groups", {"teacher_id": current_user["id"]})
         group_ids = [g["id"] for g in groups]
-        attendances = db.find("attendances", {"group_id": {"$in": group_ids}})
+        query = {"group_id": {"$in": group_ids}}
     else:
-        attendances = db.find("attendances")
-    return attendances
+        query = {}
+    items = paginate(db, "attendances", query, page, response, projection=projection)
+    if projection:
+        return projected_response(items, Attendance, projection, response)
+    return items
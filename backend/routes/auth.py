@@ -1,24 +1,31 @@
-from fastapi import APIRouter, HTTPException, status
-from database import JSONDatabase
+from fastapi import APIRouter, Depends, HTTPException, status
+from database import get_db
 from models.user import LoginRequest, LoginResponse, UserCreate, UserResponse
-from security import create_access_token, verify_password, get_password_hash
+from security import create_access_token, principal_cache
+from passwords import password_hasher
 from datetime import timedelta, datetime
 
 router = APIRouter()
 
 @router.post("/login", response_model=LoginResponse)
-async def login(credentials: LoginRequest):
+async def login(credentials: LoginRequest, db = Depends(get_db)):
     """Login user and return JWT token"""
-    db = JSONDatabase()
     users = db.find("users", {"email": credentials.email})
+    valid, new_hash = False, None
+    if users:
+        valid, new_hash = await password_hasher.verify(credentials.password, users[0].get("password", ""))
     
-    if not users or not verify_password(credentials.password, users[0].get("password", "")):
+    if not valid:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid email or password"
         )
     
     user = users[0]
+    if new_hash:
+        # Stored with a different bcrypt cost than BCRYPT_ROUNDS
+        db.update_by_id("users", user["id"], {"password": new_hash})
+        principal_cache.invalidate([user["id"]])
     access_token_expires = timedelta(minutes=30)
     access_token = create_access_token(
         data={"sub": user["email"]}, expires_delta=access_token_expires
@@ -27,6 +34,7 @@ async def login(credentials: LoginRequest):
     if "created_at" not in user:
         user["created_at"] = datetime.utcnow().isoformat()
         db.update_by_id("users", user["id"], {"created_at": user["created_at"]})
+        principal_cache.invalidate([user["id"]])
     
     user_response = UserResponse(
         id=user["id"],
@@ -42,9 +50,8 @@ async def login(credentials: LoginRequest):
     return LoginResponse(token=access_token, user=user_response)
 
 @router.post("/reset-password")
-async def reset_password(data: dict):
+async def reset_password(data: dict, db = Depends(get_db)):
     """Reset password endpoint (simplified)"""
-    db = JSONDatabase()
     users = db.find("users", {"email": data.get("email")})
     
     if not users:
@@ -57,10 +64,8 @@ async def reset_password(data: dict):
     return {"success": True, "message": "Password reset link sent to email"}
 
 @router.post("/signup", response_model=UserResponse)
-async def signup(user_data: UserCreate):
+async def signup(user_data: UserCreate, db = Depends(get_db)):
     """Create new user"""
-    db = JSONDatabase()
-    
     existing_user = db.find("users", {"email": user_data.email})
     if existing_user:
         raise HTTPException(
@@ -71,15 +76,15 @@ async def signup(user_data: UserCreate):
     user_dict = {
         "email": user_data.email,
         "name": user_data.name,
-        "password": get_password_hash(user_data.password),
-        "role": user_data.role,
+        "password": await password_hasher.hash(user_data.password),
+        "role": user_data.role.value,
         "phone": user_data.phone,
         "school_id": user_data.school_id,
         "group_id": user_data.group_id,
         "created_at": datetime.utcnow().isoformat()
     }
     
-    result = db.insert("users", user_dict)
+    result = db.insert_one("users", user_dict)
     
     return UserResponse(
         id=result["id"],
@@ -1,41 +1,81 @@
-from fastapi import APIRouter, HTTPException, Depends
-from typing import List
-from models.chat import MessageCreate, Message
-from database import JSONDatabase
+from fastapi import APIRouter, HTTPException, Depends, Query, Response
+from typing import List, Optional
+from models.chat import ConversationSummary, MessageCreate, Message
+from database import get_db
+from pagination import PageParams, paginate
+from projection import parse_fields, projected_response
 from security import get_current_user
-from datetime import datetime
+from messaging import INBOX, conversation_key, get_read_marker, is_read, mark_read, post_message, unread_counters
 
 router = APIRouter()
-db = JSONDatabase()
 
 @router.post("", response_model=Message)
-def send_message(message: MessageCreate, current_user: dict = Depends(get_current_user)):
-    message_dict = message.model_dump()
-    message_dict["is_read"] = False
-    message_dict["created_at"] = datetime.now().isoformat()
-    
-    result = db.insert_one("messages", message_dict)
-    return result
+def send_message(message: MessageCreate, current_user: dict = Depends(get_current_user), db = Depends(get_db)):
+    return post_message(db, message.model_dump())
 
 @router.get("/conversations/{user_id}", response_model=List[Message])
-def get_conversation(user_id: str, current_user: dict = Depends(get_current_user)):
-    messages = db.find("messages", {
-        "$or": [
-            {"sender_id": current_user["id"], "receiver_id": user_id},
-            {"sender_id": user_id, "receiver_id": current_user["id"]}
-        ]
-    })
+def get_conversation(
+    user_id: str,
+    response: Response,
+    page: PageParams = Depends(),
+    before: Optional[str] = Query(None, description="Message id: return only older messages"),
+    fields: Optional[str] = Query(None),
+    current_user: dict = Depends(get_current_user),
+    db = Depends(get_db)
+):
+    """Messages of one conversation, newest first"""
+    requested = parse_fields(fields, Message)
+    # Read state is computed from these even if not requested
+    projection = requested and list(dict.fromkeys([*requested, "receiver_id", "is_read", "created_at"]))
+    key = conversation_key(current_user["id"], user_id)
+    if before:
+        anchor = db.find_by_id("messages", before)
+        if anchor is None or anchor.get("conversation_key") != key:
+            raise HTTPException(status_code=404, detail="Message not found")
+        page.after = [anchor["created_at"], anchor["id"]]
+    messages = paginate(
+        db, "messages", {"conversation_key": key}, page, response,
+        sort=("created_at", -1), projection=projection
+    )
     
+    # My marker covers messages I received, the peer's covers those I sent
+    my_marker = get_read_marker(db, current_user["id"], user_id)
+    peer_marker = get_read_marker(db, user_id, current_user["id"])
+    latest_received = None
     for msg in messages:
-        if msg["receiver_id"] == current_user["id"] and not msg["is_read"]:
-            db.update_one("messages", {"id": msg["id"]}, {"is_read": True})
+        if msg["receiver_id"] == current_user["id"]:
+            latest_received = max(latest_received or "", msg["created_at"])
+            msg["is_read"] = is_read(msg, my_marker)
+        else:
+            msg["is_read"] = is_read(msg, peer_marker)
+    
+    # One marker write marks everything up to the newest message on the page read
+    if latest_received:
+        mark_read(db, current_user["id"], user_id, latest_received)
     
-    return sorted(messages, key=lambda x: x["created_at"])
+    if requested:
+        return projected_response(messages, Message, requested, response)
+    return messages
+
+@router.get("/inbox", response_model=List[ConversationSummary])
+def get_inbox(
+    response: Response,
+    page: PageParams = Depends(),
+    current_user: dict = Depends(get_current_user),
+    db = Depends(get_db)
+):
+    """One entry per conversation partner, most recent first"""
+    entries = paginate(
+        db, INBOX, {"user_id": current_user["id"]}, page, response, sort=("last_message_at", -1)
+    )
+    unread = unread_counters.by_sender(db, current_user["id"])
+    for entry in entries:
+        entry["unread_count"] = unread.get(entry["peer_id"], 0)
+    return entries
 
 @router.get("/unread")
-def get_unread_count(current_user: dict = Depends(get_current_user)):
-    unread_messages = db.find("messages", {
-        "receiver_id": current_user["id"],
-        "is_read": False
-    })
-    return {"count": len(unread_messages)}
+def get_unread_count(current_user: dict = Depends(get_current_user), db = Depends(get_db)):
+    return {
+        "count": unread_counters.total(db, current_user["id"]),
+        "conversations": unread_counters.by_sender(db, current_user["id"])
+    }
@@ -1,20 +1,27 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from database import JSONDatabase
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
+from database import get_db
+from pagination import PageParams, paginate
+from projection import parse_fields, projected_response
 from models.course import CourseResponse, CourseCreate, CourseProgressResponse, CourseProgressUpdate
-from routes.users import get_current_user
+from security import get_current_user
 from datetime import datetime
-from typing import List
+from typing import List, Optional
 
 router = APIRouter(tags=["courses"])
 
 @router.get("", response_model=List[CourseResponse])
 def get_courses(
-    current_user = Depends(get_current_user)
+    response: Response,
+    page: PageParams = Depends(),
+    fields: Optional[str] = Query(None),
+    current_user = Depends(get_current_user),
+    db = Depends(get_db)
 ):
     """Get all courses"""
-    db = JSONDatabase()
-    
-    courses = db.find("courses", {})
+    projection = parse_fields(fields, CourseResponse)
+    courses = paginate(db, "courses", {}, page, response, projection=projection)
+    if projection:
+        return projected_response(courses, CourseResponse, projection, response)
     
     return [
         CourseResponse(
@@ -32,11 +39,10 @@ def get_courses(
 @router.post("", response_model=CourseResponse)
 def create_course(
     course_data: CourseCreate,
-    current_user = Depends(get_current_user)
+    current_user = Depends(get_current_user),
+    db = Depends(get_db)
 ):
     """Create new course"""
-    db = JSONDatabase()
-    
     course_dict = {
         "title": course_data.title,
         "description": course_data.description,
@@ -46,7 +52,7 @@ def create_course(
         "createdAt": datetime.utcnow().isoformat()
     }
     
-    result = db.insert("courses", course_dict)
+    result = db.insert_one("courses", course_dict)
     
     return CourseResponse(
         id=result["id"],
@@ -61,11 +67,10 @@ def create_course(
 @router.delete("/{course_id}")
 def delete_course(
     course_id: str,
-    current_user = Depends(get_current_user)
+    current_user = Depends(get_current_user),
+    db = Depends(get_db)
 ):
     """Delete course"""
-    db = JSONDatabase()
-    
     course = db.find_one("courses", {"id": course_id})
     if not course:
         raise HTTPException(
@@ -73,18 +78,17 @@ def delete_course(
             detail="Course not found"
         )
     
-    db.delete("courses", course_id)
+    db.delete_by_id("courses", course_id)
     return {"success": True, "message": "Course deleted"}
 
 @router.get("/{course_id}/progress/{student_id}", response_model=CourseProgressResponse)
 def get_course_progress(
     course_id: str,
     student_id: str,
-    current_user = Depends(get_current_user)
+    current_user = Depends(get_current_user),
+    db = Depends(get_db)
 ):
     """Get course progress for student"""
-    db = JSONDatabase()
-    
     progress = db.find_one("course_progress", {
         "courseId": course_id,
         "studentId": student_id
@@ -99,7 +103,7 @@ def get_course_progress(
             "progress": 0,
             "createdAt": datetime.utcnow().isoformat()
         }
-        result = db.insert("course_progress", progress_dict)
+        result = db.insert_one("course_progress", progress_dict)
         progress = result
     
     videos_watched = len(progress.get("videosWatched", []))
@@ -120,11 +124,10 @@ def update_course_progress(
     course_id: str,
     student_id: str,
     progress_data: CourseProgressUpdate,
-    current_user = Depends(get_current_user)
+    current_user = Depends(get_current_user),
+    db = Depends(get_db)
 ):
     """Update course progress for student"""
-    db = JSONDatabase()
-    
     progress = db.find_one("course_progress", {
         "courseId": course_id,
         "studentId": student_id
@@ -139,7 +142,7 @@ def update_course_progress(
             "progress": 0,
             "createdAt": datetime.utcnow().isoformat()
         }
-        result = db.insert("course_progress", progress_dict)
+        result = db.insert_one("course_progress", progress_dict)
         progress = result
     else:
         update_dict = {}
@@ -148,7 +151,7 @@ def update_course_progress(
         if progress_data.testsCompleted is not None:
             update_dict["testsCompleted"] = progress_data.testsCompleted
         
-        db.update("course_progress", progress["id"], update_dict)
+        db.update_by_id("course_progress", progress["id"], update_dict)
         progress = db.find_one("course_progress", {"id": progress["id"]})
     
     videos_watched = len(progress.get("videosWatched", []))
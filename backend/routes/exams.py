@@ -1,15 +1,16 @@
-from fastapi import APIRouter, HTTPException, Depends
-from typing import List
+from fastapi import APIRouter, HTTPException, Depends, Query, Response
+from typing import List, Optional
 from models.exam import ExamCreate, ExamUpdate, Exam, ExamResult, ExamOption
-from database import JSONDatabase
+from database import get_db
+from pagination import PageParams, paginate
+from projection import parse_fields, projected_response
 from security import get_current_user
 from datetime import datetime
 
 router = APIRouter()
-db = JSONDatabase()
 
 @router.post("", response_model=Exam)
-def create_exam(exam: ExamCreate, current_user: dict = Depends(get_current_user)):
+def create_exam(exam: ExamCreate, current_user: dict = Depends(get_current_user), db = Depends(get_db)):
     if current_user["role"] != "teacher":
         raise HTTPException(status_code=403, detail="Only teachers can create exams")
     
@@ -23,19 +24,31 @@ def create_exam(exam: ExamCreate, current_user: dict = Depends(get_current_user)
     return result
 
 @router.get("", response_model=List[Exam])
-def get_exams(current_user: dict = Depends(get_current_user)):
+def get_exams(
+    response: Response,
+    page: PageParams = Depends(),
+    fields: Optional[str] = Query(None),
+    current_user: dict = Depends(get_current_user),
+    db = Depends(get_db)
+):
+    projection = parse_fields(fields, Exam)
     if current_user["role"] == "teacher":
-        exams = db.find("exams", {"teacher_id": current_user["id"]})
+        query = {"teacher_id": current_user["id"]}
     elif current_user["role"] == "student":
         user = db.find_one("users", {"id": current_user["id"]})
         group_id = user.get("group_id")
-        exams = db.find("exams", {"group_ids": {"$in": [group_id]}}) if group_id else []
+        if not group_id:
+            return []
+        query = {"group_ids": {"$in": [group_id]}}
     else:
-        exams = db.find("exams")
-    return exams
+        query = {}
+    items = paginate(db, "exams", query, page, response, projection=projection)
+    if projection:
+        return projected_response(items, Exam, projection, response)
+    return items
 
 @router.post("/{exam_id}/results")
-def add_exam_result(exam_id: str, result: ExamResult, current_user: dict = Depends(get_current_user)):
+def add_exam_result(exam_id: str, result: ExamResult, current_user: dict = Depends(get_current_user), db = Depends(get_db)):
     if current_user["role"] != "teacher":
         raise HTTPException(status_code=403, detail="Only teachers can add results")
     
@@ -0,0 +1,37 @@
+from fastapi import APIRouter, Depends, HTTPException, status, Query
+from database import get_db
+from models.grade import Gradebook
+from security import get_current_user
+from gradebook import gradebook_cache
+
+router = APIRouter()
+
+@router.get("", response_model=Gradebook)
+def get_gradebook(
+    groupId: str = Query(...),
+    current_user = Depends(get_current_user),
+    db = Depends(get_db)
+):
+    """Weighted averages per student and lesson of a group"""
+    group = db.find_by_id("groups", groupId)
+    if not group:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Group not found"
+        )
+    
+    role = current_user.get("role")
+    if role == "student":
+        if current_user["id"] not in group.get("student_ids", []):
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Access denied")
+    elif role == "teacher":
+        if group.get("teacher_id") != current_user["id"]:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Access denied")
+    elif role not in ["super_admin", "school_admin"]:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Access denied")
+    
+    gradebook = gradebook_cache.get(db, group)
+    if role == "student":
+        # Students only see their own row
+        return {**gradebook, "students": [s for s in gradebook["students"] if s["studentId"] == current_user["id"]]}
+    return gradebook
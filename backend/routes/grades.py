@@ -1,7 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from database import JSONDatabase
-from models.grade import GradeResponse, GradeCreate, GradeUpdate
-from routes.users import get_current_user
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
+from database import get_db
+from pagination import PageParams, paginate
+from projection import parse_fields, projected_response
+from models.grade import GradeResponse, GradeCreate, GradeUpdate, GradeBulkUpsert, GradeBulkResult
+from security import get_current_user
+from gradebook import gradebook_cache
 from datetime import datetime
 from typing import List, Optional
 
@@ -9,20 +12,25 @@ router = APIRouter(tags=["grades"])
 
 @router.get("", response_model=List[GradeResponse])
 def get_grades(
+    response: Response,
     studentId: Optional[str] = Query(None),
     lessonId: Optional[str] = Query(None),
-    current_user = Depends(get_current_user)
+    page: PageParams = Depends(),
+    fields: Optional[str] = Query(None),
+    current_user = Depends(get_current_user),
+    db = Depends(get_db)
 ):
     """Get all grades"""
-    db = JSONDatabase()
-    
     query = {}
     if studentId:
         query["studentId"] = studentId
     if lessonId:
         query["lessonId"] = lessonId
     
-    grades = db.find("grades", query)
+    projection = parse_fields(fields, GradeResponse)
+    grades = paginate(db, "grades", query, page, response, projection=projection)
+    if projection:
+        return projected_response(grades, GradeResponse, projection, response)
     
     return [
         GradeResponse(
@@ -40,11 +48,10 @@ def get_grades(
 @router.post("", response_model=GradeResponse)
 def create_grade(
     grade_data: GradeCreate,
-    current_user = Depends(get_current_user)
+    current_user = Depends(get_current_user),
+    db = Depends(get_db)
 ):
     """Create new grade"""
-    db = JSONDatabase()
-    
     grade_dict = {
         "studentId": grade_data.studentId,
         "lessonId": grade_data.lessonId,
@@ -54,7 +61,8 @@ def create_grade(
         "createdAt": datetime.utcnow().isoformat()
     }
     
-    result = db.insert("grades", grade_dict)
+    result = db.insert_one("grades", grade_dict)
+    gradebook_cache.invalidate_lessons(db, [grade_data.lessonId])
     
     return GradeResponse(
         id=result["id"],
@@ -66,15 +74,79 @@ def create_grade(
         createdAt=grade_dict["createdAt"]
     )
 
+def _grade_response(grade: dict) -> GradeResponse:
+    return GradeResponse(
+        id=grade["id"],
+        studentId=grade["studentId"],
+        lessonId=grade["lessonId"],
+        score=grade["score"],
+        element=grade["element"],
+        status=grade.get("status", "pending"),
+        createdAt=grade.get("createdAt")
+    )
+
+@router.post("/bulk", response_model=GradeBulkResult)
+def bulk_upsert_grades(
+    request: GradeBulkUpsert,
+    current_user = Depends(get_current_user),
+    db = Depends(get_db)
+):
+    """Upsert a lesson's student x element scores in one write"""
+    lesson = db.find_by_id("lessons", request.lessonId)
+    if not lesson:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Lesson not found"
+        )
+    
+    group = db.find_by_id("groups", lesson["groupId"]) if lesson.get("groupId") else None
+    if current_user.get("role") == "teacher":
+        if group is None or group.get("teacher_id") != current_user["id"]:
+            raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Access denied")
+    elif current_user.get("role") not in ["super_admin", "school_admin"]:
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Access denied")
+    
+    declared = {element["name"] for element in lesson.get("assessmentElements") or []}
+    unknown = {element for row in request.scores.values() for element in row} - declared
+    if declared and unknown:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Unknown assessment elements: {', '.join(sorted(unknown))}"
+        )
+    if group is not None:
+        strangers = set(request.scores) - set(group.get("student_ids", []))
+        if strangers:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"Students not in the lesson's group: {', '.join(sorted(strangers))}"
+            )
+    
+    # Each (student, element) cell is matched to its latest grade, or
+    # inserted, inside the write so concurrent submissions can't duplicate it
+    upserts = [
+        {"lessonId": lesson["id"], "studentId": student_id, "element": element, "score": score, "status": "graded"}
+        for student_id, row in request.scores.items()
+        for element, score in row.items()
+    ]
+    updated, inserted = db.bulk_write("grades", upserts=upserts, upsert_key=("lessonId", "studentId", "element"))
+    if updated or inserted:
+        gradebook_cache.invalidate([lesson.get("groupId")])
+    
+    return GradeBulkResult(
+        inserted=len(inserted),
+        updated=len(updated),
+        unchanged=len(upserts) - len(updated) - len(inserted),
+        grades=[_grade_response(grade) for grade in updated + inserted]
+    )
+
 @router.put("/{grade_id}", response_model=GradeResponse)
 def update_grade(
     grade_id: str,
     grade_data: GradeUpdate,
-    current_user = Depends(get_current_user)
+    current_user = Depends(get_current_user),
+    db = Depends(get_db)
 ):
     """Update grade"""
-    db = JSONDatabase()
-    
     grade = db.find_one("grades", {"id": grade_id})
     if not grade:
         raise HTTPException(
@@ -91,7 +163,8 @@ def update_grade(
         update_data["status"] = grade_data.status
     
     if update_data:
-        db.update("grades", grade_id, update_data)
+        db.update_by_id("grades", grade_id, update_data)
+        gradebook_cache.invalidate_lessons(db, [grade["lessonId"]])
     
     updated_grade = db.find_one("grades", {"id": grade_id})
     
@@ -108,11 +181,10 @@ def update_grade(
 @router.delete("/{grade_id}")
 def delete_grade(
     grade_id: str,
-    current_user = Depends(get_current_user)
+    current_user = Depends(get_current_user),
+    db = Depends(get_db)
 ):
     """Delete grade"""
-    db = JSONDatabase()
-    
     grade = db.find_one("grades", {"id": grade_id})
     if not grade:
         raise HTTPException(
@@ -120,5 +192,6 @@ def delete_grade(
             detail="Grade not found"
         )
     
-    db.delete("grades", grade_id)
+    db.delete_by_id("grades", grade_id)
+    gradebook_cache.invalidate_lessons(db, [grade["lessonId"]])
     return {"success": True, "message": "Grade deleted"}
@@ -1,15 +1,17 @@
-from fastapi import APIRouter, HTTPException, Depends
-from typing import List
+from fastapi import APIRouter, HTTPException, Depends, Query, Response
+from typing import List, Optional
 from models.group import GroupCreate, GroupUpdate, Group
-from database import JSONDatabase
-from security import get_current_user
+from database import get_db
+from pagination import PageParams, paginate
+from projection import parse_fields, projected_response
+from security import get_current_user, principal_cache
 from datetime import datetime
+from gradebook import gradebook_cache
 
 router = APIRouter()
-db = JSONDatabase()
 
 @router.post("", response_model=Group)
-def create_group(group: GroupCreate, current_user: dict = Depends(get_current_user)):
+def create_group(group: GroupCreate, current_user: dict = Depends(get_current_user), db = Depends(get_db)):
     if current_user["role"] not in ["teacher"]:
         raise HTTPException(status_code=403, detail="Only teachers can create groups")
     
@@ -23,24 +25,34 @@ def create_group(group: GroupCreate, current_user: dict = Depends(get_current_us
     return result
 
 @router.get("", response_model=List[Group])
-def get_groups(current_user: dict = Depends(get_current_user)):
+def get_groups(
+    response: Response,
+    page: PageParams = Depends(),
+    fields: Optional[str] = Query(None),
+    current_user: dict = Depends(get_current_user),
+    db = Depends(get_db)
+):
+    projection = parse_fields(fields, Group)
     if current_user["role"] == "teacher":
-        groups = db.find("groups", {"teacher_id": current_user["id"]})
+        query = {"teacher_id": current_user["id"]}
     elif current_user["role"] == "student":
-        groups = db.find("groups", {"student_ids": {"$in": [current_user["id"]]}})
+        query = {"student_ids": {"$in": [current_user["id"]]}}
     else:
-        groups = db.find("groups")
-    return groups
+        query = {}
+    items = paginate(db, "groups", query, page, response, projection=projection)
+    if projection:
+        return projected_response(items, Group, projection, response)
+    return items
 
 @router.get("/{group_id}", response_model=Group)
-def get_group(group_id: str, current_user: dict = Depends(get_current_user)):
+def get_group(group_id: str, current_user: dict = Depends(get_current_user), db = Depends(get_db)):
     group = db.find_one("groups", {"id": group_id})
     if not group:
         raise HTTPException(status_code=404, detail="Group not found")
     return group
 
 @router.put("/{group_id}", response_model=Group)
-def update_group(group_id: str, group_update: GroupUpdate, current_user: dict = Depends(get_current_user)):
+def update_group(group_id: str, group_update: GroupUpdate, current_user: dict = Depends(get_current_user), db = Depends(get_db)):
     existing_group = db.find_one("groups", {"id": group_id})
     if not existing_group:
         raise HTTPException(status_code=404, detail="Group not found")
@@ -55,7 +67,7 @@ def update_group(group_id: str, group_update: GroupUpdate, current_user: dict =
     return updated_group
 
 @router.delete("/{group_id}")
-def delete_group(group_id: str, current_user: dict = Depends(get_current_user)):
+def delete_group(group_id: str, current_user: dict = Depends(get_current_user), db = Depends(get_db)):
     existing_group = db.find_one("groups", {"id": group_id})
     if not existing_group:
         raise HTTPException(status_code=404, detail="Group not found")
@@ -67,7 +79,7 @@ def delete_group(group_id: str, current_user: dict = Depends(get_current_user)):
     return {"message": "Group deleted successfully"}
 
 @router.post("/{group_id}/students/{student_id}")
-def add_student_to_group(group_id: str, student_id: str, current_user: dict = Depends(get_current_user)):
+def add_student_to_group(group_id: str, student_id: str, current_user: dict = Depends(get_current_user), db = Depends(get_db)):
     if current_user["role"] != "teacher":
         raise HTTPException(status_code=403, detail="Only teachers can add students")
     
@@ -76,15 +88,16 @@ def add_student_to_group(group_id: str, student_id: str, current_user: dict = De
         raise HTTPException(status_code=404, detail="Group not found")
     
     if student_id not in group.get("student_ids", []):
-        group["student_ids"].append(student_id)
-        db.update_one("groups", {"id": group_id}, {"student_ids": group["student_ids"]})
+        db.update_one("groups", {"id": group_id}, {"$addToSet": {"student_ids": student_id}})
+        gradebook_cache.invalidate([group_id])
     
     db.update_one("users", {"id": student_id}, {"group_id": group_id})
+    principal_cache.invalidate([student_id])
     
     return {"message": "Student added to group successfully"}
 
 @router.delete("/{group_id}/students/{student_id}")
-def remove_student_from_group(group_id: str, student_id: str, current_user: dict = Depends(get_current_user)):
+def remove_student_from_group(group_id: str, student_id: str, current_user: dict = Depends(get_current_user), db = Depends(get_db)):
     if current_user["role"] != "teacher":
         raise HTTPException(status_code=403, detail="Only teachers can remove students")
     
@@ -93,9 +106,10 @@ def remove_student_from_group(group_id: str, student_id: str, current_user: dict
         raise HTTPException(status_code=404, detail="Group not found")
     
     if student_id in group.get("student_ids", []):
-        group["student_ids"].remove(student_id)
-        db.update_one("groups", {"id": group_id}, {"student_ids": group["student_ids"]})
+        db.update_one("groups", {"id": group_id}, {"$pull": {"student_ids": student_id}})
+        gradebook_cache.invalidate([group_id])
     
     db.update_one("users", {"id": student_id}, {"group_id": None})
+    principal_cache.invalidate([student_id])
     
     return {"message": "Student removed from group successfully"}
@@ -1,7 +1,10 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from database import JSONDatabase
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
+from database import get_db
+from pagination import PageParams, paginate
+from projection import parse_fields, projected_response
 from models.lesson import LessonResponse, LessonCreate, LessonUpdate
-from routes.users import get_current_user
+from security import get_current_user
+from gradebook import gradebook_cache
 from datetime import datetime
 from typing import List, Optional
 
@@ -9,20 +12,25 @@ router = APIRouter()
 
 @router.get("", response_model=List[LessonResponse])
 def get_lessons(
+    response: Response,
     groupId: Optional[str] = Query(None),
     teacherId: Optional[str] = Query(None),
-    current_user = Depends(get_current_user)
+    page: PageParams = Depends(),
+    fields: Optional[str] = Query(None),
+    current_user = Depends(get_current_user),
+    db = Depends(get_db)
 ):
     """Get all lessons"""
-    db = JSONDatabase()
-    
     query = {}
     if groupId:
         query["groupId"] = groupId
     if teacherId:
         query["teacherId"] = teacherId
     
-    lessons = db.find("lessons", query)
+    projection = parse_fields(fields, LessonResponse)
+    lessons = paginate(db, "lessons", query, page, response, projection=projection)
+    if projection:
+        return projected_response(lessons, LessonResponse, projection, response)
     
     return [
         LessonResponse(
@@ -41,22 +49,22 @@ def get_lessons(
 @router.post("", response_model=LessonResponse, status_code=status.HTTP_201_CREATED)
 def create_lesson(
     lesson_data: LessonCreate,
-    current_user = Depends(get_current_user)
+    current_user = Depends(get_current_user),
+    db = Depends(get_db)
 ):
     """Create new lesson"""
-    db = JSONDatabase()
-    
     lesson_dict = {
         "title": lesson_data.title,
         "subject": lesson_data.subject,
         "description": lesson_data.description,
-        "assessmentElements": [elem.dict() for elem in lesson_data.assessmentElements] if lesson_data.assessmentElements else [],
+        "assessmentElements": [elem.model_dump() for elem in lesson_data.assessmentElements] if lesson_data.assessmentElements else [],
         "groupId": lesson_data.groupId,
         "teacherId": lesson_data.teacherId or current_user.get("id"),
         "createdAt": datetime.utcnow().isoformat()
     }
     
-    created_lesson = db.insert("lessons", lesson_dict)
+    created_lesson = db.insert_one("lessons", lesson_dict)
+    gradebook_cache.invalidate([created_lesson.get("groupId")])
     
     return LessonResponse(**created_lesson)
 
@@ -64,11 +72,10 @@ def create_lesson(
 def update_lesson(
     lesson_id: str,
     lesson_data: LessonUpdate,
-    current_user = Depends(get_current_user)
+    current_user = Depends(get_current_user),
+    db = Depends(get_db)
 ):
     """Update lesson"""
-    db = JSONDatabase()
-    
     lesson = db.find_one("lessons", {"id": lesson_id})
     if not lesson:
         raise HTTPException(
@@ -79,19 +86,16 @@ def update_lesson(
     update_data = {}
     if lesson_data.title:
         update_data["title"] = lesson_data.title
-    if lesson_data.date:
-        update_data["date"] = lesson_data.date
-    if lesson_data.time:
-        update_data["time"] = lesson_data.time
     if lesson_data.subject:
         update_data["subject"] = lesson_data.subject
     if hasattr(lesson_data, 'description') and lesson_data.description:
         update_data["description"] = lesson_data.description
     if hasattr(lesson_data, 'assessmentElements') and lesson_data.assessmentElements:
-        update_data["assessmentElements"] = lesson_data.assessmentElements
+        update_data["assessmentElements"] = [elem.model_dump() for elem in lesson_data.assessmentElements]
     
     if update_data:
-        db.update("lessons", lesson_id, update_data)
+        db.update_by_id("lessons", lesson_id, update_data)
+        gradebook_cache.invalidate([lesson.get("groupId")])
     
     updated_lesson = db.find_one("lessons", {"id": lesson_id})
     
@@ -100,11 +104,10 @@ def update_lesson(
 @router.delete("/{lesson_id}")
 def delete_lesson(
     lesson_id: str,
-    current_user = Depends(get_current_user)
+    current_user = Depends(get_current_user),
+    db = Depends(get_db)
 ):
     """Delete lesson"""
-    db = JSONDatabase()
-    
     lesson = db.find_one("lessons", {"id": lesson_id})
     if not lesson:
         raise HTTPException(
@@ -112,6 +115,7 @@ def delete_lesson(
             detail="Lesson not found"
         )
     
-    db.delete("lessons", lesson_id)
+    db.delete_by_id("lessons", lesson_id)
+    gradebook_cache.invalidate([lesson.get("groupId")])
     
     return {"success": True, "message": "Lesson deleted successfully"}
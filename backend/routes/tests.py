@@ -1,7 +1,9 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
-from database import JSONDatabase
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
+from database import get_db
+from pagination import PageParams, paginate
+from projection import parse_fields, projected_response
 from models.test import TestResponse, TestCreate, TestUpdate, TestResultResponse, TestResultCreate
-from routes.users import get_current_user
+from security import get_current_user
 from datetime import datetime
 from typing import List, Optional
 
@@ -9,17 +11,22 @@ router = APIRouter(tags=["tests"])
 
 @router.get("", response_model=List[TestResponse])
 def get_tests(
+    response: Response,
     groupId: Optional[str] = Query(None),
-    current_user = Depends(get_current_user)
+    page: PageParams = Depends(),
+    fields: Optional[str] = Query(None),
+    current_user = Depends(get_current_user),
+    db = Depends(get_db)
 ):
     """Get all tests"""
-    db = JSONDatabase()
-    
     query = {}
     if groupId:
         query["groupId"] = groupId
     
-    tests = db.find("tests", query)
+    projection = parse_fields(fields, TestResponse)
+    tests = paginate(db, "tests", query, page, response, projection=projection)
+    if projection:
+        return projected_response(tests, TestResponse, projection, response)
     
     return [
         TestResponse(
@@ -38,11 +45,10 @@ def get_tests(
 @router.post("", response_model=TestResponse)
 def create_test(
     test_data: TestCreate,
-    current_user = Depends(get_current_user)
+    current_user = Depends(get_current_user),
+    db = Depends(get_db)
 ):
     """Create new test"""
-    db = JSONDatabase()
-    
     test_dict = {
         "title": test_data.title,
         "groupId": test_data.groupId,
@@ -53,7 +59,7 @@ def create_test(
         "createdAt": datetime.utcnow().isoformat()
     }
     
-    result = db.insert("tests", test_dict)
+    result = db.insert_one("tests", test_dict)
     
     return TestResponse(
         id=result["id"],
@@ -70,11 +76,10 @@ def create_test(
 def update_test(
     test_id: str,
     test_data: TestUpdate,
-    current_user = Depends(get_current_user)
+    current_user = Depends(get_current_user),
+    db = Depends(get_db)
 ):
     """Update test"""
-    db = JSONDatabase()
-    
     test = db.find_one("tests", {"id": test_id})
     if not test:
         raise HTTPException(
@@ -95,7 +100,7 @@ def update_test(
         update_data["status"] = test_data.status
     
     if update_data:
-        db.update("tests", test_id, update_data)
+        db.update_by_id("tests", test_id, update_data)
     
     updated_test = db.find_one("tests", {"id": test_id})
     
@@ -113,11 +118,10 @@ def update_test(
 @router.delete("/{test_id}")
 def delete_test(
     test_id: str,
-    current_user = Depends(get_current_user)
+    current_user = Depends(get_current_user),
+    db = Depends(get_db)
 ):
     """Delete test"""
-    db = JSONDatabase()
-    
     test = db.find_one("tests", {"id": test_id})
     if not test:
         raise HTTPException(
@@ -125,25 +129,30 @@ def delete_test(
             detail="Test not found"
         )
     
-    db.delete("tests", test_id)
+    db.delete_by_id("tests", test_id)
     return {"success": True, "message": "Test deleted"}
 
 @router.get("/results", response_model=List[TestResultResponse])
 def get_test_results(
+    response: Response,
     testId: Optional[str] = Query(None),
     studentId: Optional[str] = Query(None),
-    current_user = Depends(get_current_user)
+    page: PageParams = Depends(),
+    fields: Optional[str] = Query(None),
+    current_user = Depends(get_current_user),
+    db = Depends(get_db)
 ):
     """Get test results"""
-    db = JSONDatabase()
-    
     query = {}
     if testId:
         query["testId"] = testId
     if studentId:
         query["studentId"] = studentId
     
-    results = db.find("test_results", query)
+    projection = parse_fields(fields, TestResultResponse)
+    results = paginate(db, "test_results", query, page, response, projection=projection)
+    if projection:
+        return projected_response(results, TestResultResponse, projection, response)
     
     return [
         TestResultResponse(
@@ -161,11 +170,10 @@ def get_test_results(
 @router.post("/results", response_model=TestResultResponse)
 def submit_test_result(
     result_data: TestResultCreate,
-    current_user = Depends(get_current_user)
+    current_user = Depends(get_current_user),
+    db = Depends(get_db)
 ):
     """Submit test result"""
-    db = JSONDatabase()
-    
     result_dict = {
         "testId": result_data.testId,
         "studentId": result_data.studentId,
@@ -175,7 +183,7 @@ def submit_test_result(
         "createdAt": datetime.utcnow().isoformat()
     }
     
-    insert_result = db.insert("test_results", result_dict)
+    insert_result = db.insert_one("test_results", result_dict)
     
     return TestResultResponse(
         id=insert_result["id"],
@@ -1,37 +1,28 @@
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response, UploadFile, File
+from pydantic import ValidationError
 from database import get_db
-from models.user import UserResponse, UserCreate, UserUpdate
-from security import get_password_hash, decode_token
-from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from pagination import PageParams, paginate
+from projection import parse_fields, projected_response
+from models.user import UserResponse, UserCreate, UserUpdate, UserRole, UserImportRow, UserImportReport
+from security import get_current_user, get_password_hash, principal_cache
+from passwords import password_hasher
+from gradebook import gradebook_cache
+from config import settings
 from datetime import datetime
-from typing import List, Optional
+from typing import List, Optional, Tuple
+import csv
+import io
+import json
 
 router = APIRouter()
-security = HTTPBearer()
-
-def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security), db = Depends(get_db)):
-    """Verify JWT token and return current user"""
-    token_data = decode_token(credentials.credentials)
-    if not token_data:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Invalid token"
-        )
-    
-    users = db.find("users", {"email": token_data.email})
-    
-    if not users:
-        raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="User not found"
-        )
-    
-    return users[0]
 
 @router.get("", response_model=List[UserResponse])
 def get_users(
+    response: Response,
     role: Optional[str] = Query(None),
     school_id: Optional[str] = Query(None),
+    page: PageParams = Depends(),
+    fields: Optional[str] = Query(None),
     db = Depends(get_db),
     current_user = Depends(get_current_user)
 ):
@@ -42,7 +33,10 @@ def get_users(
     if school_id:
         query["school_id"] = school_id
     
-    users = db.find("users", query)
+    projection = parse_fields(fields, UserResponse)
+    users = paginate(db, "users", query, page, response, projection=projection)
+    if projection:
+        return projected_response(users, UserResponse, projection, response)
     
     return [
         UserResponse(
@@ -58,6 +52,134 @@ def get_users(
         for user in users
     ]
 
+def parse_import_rows(content: bytes, fmt: str) -> List[Tuple[int, Optional[dict], Optional[str]]]:
+    """Split an import file into (line number, raw row, parse error) tuples"""
+    text = content.decode("utf-8-sig")
+    rows = []
+    if fmt == "csv":
+        reader = csv.DictReader(io.StringIO(text))
+        for row in reader:
+            # Empty cells mean "not given"
+            rows.append((reader.line_num, {k: v.strip() or None for k, v in row.items() if k and v is not None}, None))
+    else:
+        for line_num, line in enumerate(text.splitlines(), start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                rows.append((line_num, None, f"Invalid JSON: {e}"))
+                continue
+            if not isinstance(row, dict):
+                rows.append((line_num, None, "Row must be a JSON object"))
+                continue
+            rows.append((line_num, row, None))
+    return rows
+
+@router.post("/import", response_model=UserImportReport)
+def import_users(
+    file: UploadFile = File(...),
+    format: Optional[str] = Query(None, pattern="^(csv|jsonl)$"),
+    role: UserRole = Query(UserRole.STUDENT),
+    school_id: Optional[str] = Query(None),
+    group_id: Optional[str] = Query(None),
+    db = Depends(get_db),
+    current_user = Depends(get_current_user)
+):
+    """Bulk-create users from CSV (with a header row) or JSON lines.
+    
+    Rows without role/school_id/group_id get the query parameter values.
+    Valid rows are created even if others fail; the report lists each row.
+    """
+    if current_user["role"] not in ["super_admin", "school_admin"]:
+        raise HTTPException(status_code=403, detail="Only admins can import users")
+    
+    fmt = format or ("jsonl" if (file.filename or "").endswith((".jsonl", ".ndjson", ".json")) else "csv")
+    try:
+        rows = parse_import_rows(file.file.read(), fmt)
+    except (UnicodeDecodeError, csv.Error) as e:
+        raise HTTPException(status_code=400, detail=f"Cannot read file: {e}")
+    if len(rows) > settings.USER_IMPORT_MAX_ROWS:
+        raise HTTPException(status_code=400, detail=f"Too many rows (max {settings.USER_IMPORT_MAX_ROWS})")
+    
+    # Validate every row before touching storage
+    report = {}
+    valid = []
+    for line_num, raw, error in rows:
+        if error:
+            report[line_num] = UserImportRow(row=line_num, status="error", error=error)
+            continue
+        raw = {"role": role, "school_id": school_id, "group_id": group_id, **{k: v for k, v in raw.items() if v is not None}}
+        try:
+            user = UserCreate(**raw)
+        except ValidationError as e:
+            first = e.errors()[0]
+            field = ".".join(str(part) for part in first["loc"])
+            report[line_num] = UserImportRow(row=line_num, email=raw.get("email"), status="error", error=f"{field}: {first['msg']}")
+            continue
+        valid.append((line_num, user))
+    
+    # Dedupe against existing users (email index) and within the file
+    emails = [user.email for _, user in valid]
+    taken = {u["email"] for u in db.find("users", {"email": {"$in": emails}}, projection=["email"])}
+    group_ids = {user.group_id for _, user in valid if user.group_id}
+    groups = {g["id"]: g for g in db.find("groups", {"id": {"$in": list(group_ids)}})}
+    seen = set()
+    accepted = []
+    for line_num, user in valid:
+        error = None
+        if user.email in taken:
+            error = "Email already exists"
+        elif user.email in seen:
+            error = "Duplicate email in file"
+        elif user.group_id and user.group_id not in groups:
+            error = "Group not found"
+        if error:
+            report[line_num] = UserImportRow(row=line_num, email=user.email, status="error", error=error)
+            continue
+        seen.add(user.email)
+        accepted.append((line_num, user))
+    
+    hashes = password_hasher.hash_many([user.password for _, user in accepted])
+    created_at = datetime.utcnow().isoformat()
+    documents = [
+        {
+            "email": user.email,
+            "name": user.name,
+            "password": password_hash,
+            "role": user.role.value,
+            "phone": user.phone,
+            "school_id": user.school_id,
+            "group_id": user.group_id,
+            "created_at": created_at
+        }
+        for (_, user), password_hash in zip(accepted, hashes)
+    ]
+    inserted = db.insert_many("users", documents) if documents else []
+    
+    # New students join their groups in one write; $addToSet merges with
+    # the stored student_ids under the write lock, not with the copy read above
+    new_members = {}
+    for doc in inserted:
+        if doc["group_id"] and doc["role"] == UserRole.STUDENT.value:
+            new_members.setdefault(doc["group_id"], []).append(doc["id"])
+    if new_members:
+        db.bulk_write("groups", updates=[
+            ({"id": gid}, {"$addToSet": {"student_ids": {"$each": student_ids}}})
+            for gid, student_ids in new_members.items()
+        ])
+        gradebook_cache.invalidate(new_members)
+    
+    for (line_num, user), doc in zip(accepted, inserted):
+        report[line_num] = UserImportRow(row=line_num, email=user.email, status="created", id=doc["id"])
+    
+    ordered = [report[line_num] for line_num in sorted(report)]
+    return UserImportReport(
+        created=len(inserted),
+        failed=len(ordered) - len(inserted),
+        rows=ordered
+    )
+
 @router.get("/{user_id}", response_model=UserResponse)
 def get_user(
     user_id: str,
@@ -106,7 +228,7 @@ def create_user(
             "email": user_data.email,
             "name": user_data.name,
             "password": get_password_hash(user_data.password),
-            "role": user_data.role,
+            "role": user_data.role.value,
             "phone": user_data.phone,
             "school_id": user_data.school_id,
             "group_id": user_data.group_id,
@@ -164,7 +286,7 @@ def update_user(
     if user_data.phone:
         update_data["phone"] = user_data.phone
     if user_data.role:
-        update_data["role"] = user_data.role
+        update_data["role"] = user_data.role.value
     if user_data.school_id:
         update_data["school_id"] = user_data.school_id
     if user_data.group_id:
@@ -172,6 +294,7 @@ def update_user(
     
     if update_data:
         db.update_by_id("users", user_id, update_data)
+        principal_cache.invalidate([user_id])
     
     updated_user = db.find_by_id("users", user_id)
     
@@ -194,6 +317,7 @@ def delete_user(
 ):
     """Delete user"""
     result = db.delete_by_id("users", user_id)
+    principal_cache.invalidate([user_id])
     
     if not result:
         raise HTTPException(
@@ -1,19 +1,21 @@
-from fastapi import APIRouter, HTTPException, Depends
-from typing import List
+from fastapi import APIRouter, HTTPException, Depends, Query, Response
+from typing import List, Optional
 from models.video_course import (
     VideoCourseCreate, VideoCourseUpdate, VideoCourse,
     Video, VideoCreate, Quiz, QuizCreate, CourseAccessRequest
 )
-from database import JSONDatabase
+from database import get_db
+from pagination import PageParams, paginate
+from projection import parse_fields, projected_response
 from security import get_current_user
+from messaging import post_message
 from datetime import datetime
 import uuid
 
 router = APIRouter()
-db = JSONDatabase()
 
 @router.post("", response_model=VideoCourse)
-def create_video_course(course: VideoCourseCreate, current_user: dict = Depends(get_current_user)):
+def create_video_course(course: VideoCourseCreate, current_user: dict = Depends(get_current_user), db = Depends(get_db)):
     if current_user["role"] != "teacher":
         raise HTTPException(status_code=403, detail="Only teachers can create courses")
     
@@ -27,36 +29,41 @@ def create_video_course(course: VideoCourseCreate, current_user: dict = Depends(
     return result
 
 @router.get("", response_model=List[VideoCourse])
-def get_video_courses(current_user: dict = Depends(get_current_user)):
+def get_video_courses(
+    response: Response,
+    page: PageParams = Depends(),
+    fields: Optional[str] = Query(None),
+    current_user: dict = Depends(get_current_user),
+    db = Depends(get_db)
+):
+    projection = parse_fields(fields, VideoCourse)
     if current_user["role"] == "teacher":
-        courses = db.find("video_courses", {"teacher_id": current_user["id"]})
+        query = {"teacher_id": current_user["id"]}
     elif current_user["role"] == "student":
         user = db.find_one("users", {"id": current_user["id"]})
         group_id = user.get("group_id")
         
-        free_courses = db.find("video_courses", {
-            "is_free": True,
-            "allowed_group_ids": {"$in": [group_id]} if group_id else []
-        })
-        
         approved_requests = db.find("course_access_requests", {
             "student_id": current_user["id"],
             "status": "approved"
         })
         approved_course_ids = [req["course_id"] for req in approved_requests]
         
-        paid_courses = db.find("video_courses", {
-            "id": {"$in": approved_course_ids}
-        })
-        
-        courses = free_courses + paid_courses
+        # Free courses for the student's group, then paid courses with approved access
+        query = {"$or": [
+            {"is_free": True, "allowed_group_ids": {"$in": [group_id]} if group_id else []},
+            {"id": {"$in": approved_course_ids}}
+        ]}
     else:
-        courses = db.find("video_courses")
+        query = {}
     
-    return courses
+    items = paginate(db, "video_courses", query, page, response, projection=projection)
+    if projection:
+        return projected_response(items, VideoCourse, projection, response)
+    return items
 
 @router.get("/{course_id}", response_model=VideoCourse)
-def get_video_course_by_id(course_id: str, current_user: dict = Depends(get_current_user)):
+def get_video_course_by_id(course_id: str, current_user: dict = Depends(get_current_user), db = Depends(get_db)):
     course = db.find_one("video_courses", {"id": course_id})
     if not course:
         raise HTTPException(status_code=404, detail="Course not found")
@@ -89,7 +96,7 @@ def get_video_course_by_id(course_id: str, current_user: dict = Depends(get_curr
     return course
 
 @router.post("/{course_id}/videos", response_model=Video)
-def add_video_to_course(course_id: str, video: VideoCreate, current_user: dict = Depends(get_current_user)):
+def add_video_to_course(course_id: str, video: VideoCreate, current_user: dict = Depends(get_current_user), db = Depends(get_db)):
     course = db.find_one("video_courses", {"id": course_id})
     if not course:
         raise HTTPException(status_code=404, detail="Course not found")
@@ -112,7 +119,7 @@ def add_video_to_course(course_id: str, video: VideoCreate, current_user: dict =
     return video_dict
 
 @router.delete("/{course_id}/videos/{video_id}")
-def delete_video_from_course(course_id: str, video_id: str, current_user: dict = Depends(get_current_user)):
+def delete_video_from_course(course_id: str, video_id: str, current_user: dict = Depends(get_current_user), db = Depends(get_db)):
     course = db.find_one("video_courses", {"id": course_id})
     if not course:
         raise HTTPException(status_code=404, detail="Course not found")
@@ -127,7 +134,7 @@ def delete_video_from_course(course_id: str, video_id: str, current_user: dict =
     return {"message": "Video deleted successfully"}
 
 @router.post("/{course_id}/videos/{video_id}/quizzes", response_model=Quiz)
-def add_quiz_to_video(course_id: str, video_id: str, quiz: QuizCreate, current_user: dict = Depends(get_current_user)):
+def add_quiz_to_video(course_id: str, video_id: str, quiz: QuizCreate, current_user: dict = Depends(get_current_user), db = Depends(get_db)):
     course = db.find_one("video_courses", {"id": course_id})
     if not course:
         raise HTTPException(status_code=404, detail="Course not found")
@@ -151,7 +158,7 @@ def add_quiz_to_video(course_id: str, video_id: str, quiz: QuizCreate, current_u
     return quiz_dict
 
 @router.delete("/{course_id}/videos/{video_id}/quizzes/{quiz_index}")
-def delete_quiz_from_video(course_id: str, video_id: str, quiz_index: int, current_user: dict = Depends(get_current_user)):
+def delete_quiz_from_video(course_id: str, video_id: str, quiz_index: int, current_user: dict = Depends(get_current_user), db = Depends(get_db)):
     course = db.find_one("video_courses", {"id": course_id})
     if not course:
         raise HTTPException(status_code=404, detail="Course not found")
@@ -171,7 +178,7 @@ def delete_quiz_from_video(course_id: str, video_id: str, quiz_index: int, curre
     return {"message": "Quiz deleted successfully"}
 
 @router.post("/{course_id}/request-access")
-def request_course_access(course_id: str, current_user: dict = Depends(get_current_user)):
+def request_course_access(course_id: str, current_user: dict = Depends(get_current_user), db = Depends(get_db)):
     if current_user["role"] != "student":
         raise HTTPException(status_code=403, detail="Only students can request access")
     
@@ -194,7 +201,7 @@ def request_course_access(course_id: str, current_user: dict = Depends(get_curre
         "created_at": datetime.now().isoformat()
     }
     
-    db.insert_one("course_access_requests", request_data)
+    access_request = db.insert_one("course_access_requests", request_data)
     
     from models.chat import MessageCreate
     message = MessageCreate(
@@ -204,15 +211,12 @@ def request_course_access(course_id: str, current_user: dict = Depends(get_curre
         message_type="course_access_request"
     )
     
-    message_dict = message.model_dump()
-    message_dict["is_read"] = False
-    message_dict["created_at"] = datetime.now().isoformat()
-    db.insert_one("messages", message_dict)
+    post_message(db, message.model_dump(), "course_access_request", access_request=access_request)
     
     return {"message": "Access request sent successfully"}
 
 @router.put("/access-requests/{request_id}")
-def update_access_request(request_id: str, status: str, current_user: dict = Depends(get_current_user)):
+def update_access_request(request_id: str, status: str, current_user: dict = Depends(get_current_user), db = Depends(get_db)):
     if current_user["role"] != "teacher":
         raise HTTPException(status_code=403, detail="Only teachers can approve requests")
     
@@ -0,0 +1,54 @@
+import asyncio
+from fastapi import APIRouter, Query, WebSocket, WebSocketDisconnect
+from typing import Optional
+from config import settings
+from database import get_db
+from realtime import Connection, hub
+from security import decode_token, resolve_principal
+
+router = APIRouter()
+
+@router.websocket("/ws")
+async def websocket_endpoint(websocket: WebSocket, token: Optional[str] = Query(None)):
+    """Push channel for chat messages and notifications.
+    
+    Authenticate with ?token=<JWT> (or an Authorization: Bearer header).
+    The server sends {"type": "ping"} when the client has been silent for
+    WS_HEARTBEAT_SECONDS; any client message, e.g. {"type": "pong"},
+    counts as alive.
+    """
+    if token is None:
+        authorization = websocket.headers.get("authorization", "")
+        if authorization.lower().startswith("bearer "):
+            token = authorization[7:]
+    token_data = decode_token(token) if token else None
+    user = await asyncio.to_thread(resolve_principal, token_data.email, get_db()) if token_data else None
+    if user is None:
+        await websocket.close(code=1008)
+        return
+    
+    await websocket.accept()
+    connection = Connection(websocket, user["id"])
+    hub.connect(connection)
+    sender = asyncio.create_task(connection.sender(hub))
+    awaiting_pong = False
+    try:
+        while not connection.closed.is_set():
+            try:
+                message = await asyncio.wait_for(websocket.receive_json(), timeout=settings.WS_HEARTBEAT_SECONDS)
+            except asyncio.TimeoutError:
+                if awaiting_pong:
+                    # Missed a heartbeat
+                    break
+                connection.enqueue({"type": "ping"})
+                awaiting_pong = True
+                continue
+            awaiting_pong = False
+            if isinstance(message, dict) and message.get("type") == "ping":
+                connection.enqueue({"type": "pong"})
+    except (WebSocketDisconnect, ValueError):
+        pass
+    finally:
+        connection.closed.set()
+        hub.disconnect(connection)
+        sender.cancel()
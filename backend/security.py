@@ -1,20 +1,21 @@
+import threading
+import time
+from collections import OrderedDict
 from datetime import datetime, timedelta, timezone
-from typing import Optional
+from typing import Iterable, Optional
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from config import settings
 from models.user import TokenData
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
-from database import JSONDatabase
-
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+from database import get_db
+from passwords import password_hasher
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+    return password_hasher.verify_sync(plain_password, hashed_password)[0]
 
 def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
+    return password_hasher.hash_sync(password)
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     to_encode = data.copy()
@@ -28,7 +29,91 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
 
 security = HTTPBearer()
 
-def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security)):
+class PrincipalCache:
+    """Bounded LRU cache of authenticated users keyed by token subject (email).
+
+    Entries expire after ttl seconds, which also bounds staleness across
+    worker processes; within a process, routes that change a user call
+    invalidate.
+    """
+    
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        # user id -> subject, so entries can be dropped by id
+        self._subjects = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+    
+    def get(self, subject: str) -> Optional[dict]:
+        """Get a copy of the cached user for subject, None if missing or expired"""
+        with self._lock:
+            entry = self._entries.get(subject)
+            if entry is None or entry[0] < time.monotonic():
+                self.misses += 1
+                return None
+            self._entries.move_to_end(subject)
+            self.hits += 1
+            return dict(entry[1])
+    
+    def put(self, subject: str, user: dict):
+        """Cache user for subject, evicting the least recently used entry"""
+        with self._lock:
+            self._drop(subject)
+            self._entries[subject] = (time.monotonic() + self.ttl, dict(user))
+            if "id" in user:
+                self._subjects[user["id"]] = subject
+            while len(self._entries) > self.max_size:
+                self._drop(next(iter(self._entries)))
+    
+    def _drop(self, subject: str):
+        entry = self._entries.pop(subject, None)
+        if entry is not None:
+            self._subjects.pop(entry[1].get("id"), None)
+    
+    def invalidate(self, user_ids: Iterable[str] = None):
+        """Drop cached entries of the given users, or all of them"""
+        with self._lock:
+            if user_ids is None:
+                self._entries.clear()
+                self._subjects.clear()
+                self.invalidations += 1
+                return
+            for user_id in user_ids:
+                subject = self._subjects.get(user_id)
+                if subject is not None:
+                    self._drop(subject)
+                    self.invalidations += 1
+    
+    def stats(self) -> dict:
+        """Get hit/miss counters"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "invalidations": self.invalidations,
+                "size": len(self._entries)
+            }
+
+principal_cache = PrincipalCache(settings.PRINCIPAL_CACHE_SIZE, settings.PRINCIPAL_CACHE_TTL)
+
+def resolve_principal(subject: str, db) -> Optional[dict]:
+    """Get the user a token subject refers to, through the principal cache"""
+    user = principal_cache.get(subject)
+    if user is not None:
+        return user
+    # Email is indexed
+    user = db.find_one("users", {"email": subject})
+    if user is not None:
+        principal_cache.put(subject, user)
+    return user
+
+def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(security), db = Depends(get_db)):
     """Extract and validate JWT token from Authorization header"""
     token = credentials.credentials
     token_data = decode_token(token)
@@ -40,17 +125,15 @@ def get_current_user(credentials: HTTPAuthorizationCredentials = Depends(securit
             headers={"WWW-Authenticate": "Bearer"},
         )
     
-    # Get user from database
-    db = JSONDatabase()
-    users = db.find("users", {"email": token_data.email})
+    user = resolve_principal(token_data.email, db)
     
-    if not users:
+    if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="User not found"
         )
     
-    return users[0]
+    return user
 
 def decode_token(token: str) -> Optional[TokenData]:
     try:
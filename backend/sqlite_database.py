@@ -0,0 +1,521 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import Future
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from config import settings
+from database import DEFAULT_INDEXES, DEFAULT_ORDERED_INDEXES, DEFAULT_PARTITIONED_INDEXES
+from query import apply_update, compile_query, is_hashable, project, sort_key
+
+_NAME_RE = re.compile(r"^[A-Za-z0-9_]+$")
+
+def _check_name(name: str) -> str:
+    if not _NAME_RE.match(name):
+        raise ValueError(f"Invalid collection or field name: {name}")
+    return name
+
+class SQLiteDatabase:
+    """SQLite storage with the same interface as JSONDatabase.
+    
+    Each collection is a table of JSON documents. Hot fields get a virtual
+    generated column with an index, and queries are narrowed in SQL on those
+    columns before the compiled query predicate filters the rows. Partitioned
+    indexes become one (partition, sort field, id) index.
+    """
+    
+    def __init__(self, path: str = None, indexes: Dict[str, List[str]] = None):
+        self.path = path or settings.SQLITE_PATH
+        self.indexes = {**DEFAULT_INDEXES, **(indexes or {})}
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._local = threading.local()
+        self._write_lock = threading.RLock()
+        self._schema_lock = threading.Lock()
+        # collection -> set of indexed fields that have a column
+        self._columns: Dict[str, set] = {}
+        # collection -> indexed fields seen holding arrays, matched element-wise
+        self._array_fields: Dict[str, set] = {}
+        # collection -> (write counter, token) handed out by collection_version
+        self._versions: Dict[str, Tuple[int, object]] = {}
+        self._versions_lock = threading.Lock()
+        
+        conn = self.connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS _array_fields ("
+            "collection TEXT NOT NULL, field TEXT NOT NULL, PRIMARY KEY (collection, field))"
+        )
+        for collection, field in conn.execute("SELECT collection, field FROM _array_fields"):
+            self._array_fields.setdefault(collection, set()).add(field)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS _versions ("
+            "collection TEXT PRIMARY KEY, version INTEGER NOT NULL)"
+        )
+    
+    def connection(self) -> sqlite3.Connection:
+        """Get this thread's connection, readers never block each other in WAL mode"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            self._local.conn = conn
+        return conn
+    
+    @staticmethod
+    def _column(field: str) -> str:
+        return f'"f_{field}"'
+    
+    def ensure_collection(self, collection: str):
+        """Create table and indexed columns for collection if missing"""
+        if collection in self._columns:
+            return
+        with self._schema_lock:
+            if collection in self._columns:
+                return
+            table = _check_name(collection)
+            conn = self.connection()
+            conn.execute(
+                f'CREATE TABLE IF NOT EXISTS "{table}" ('
+                "seq INTEGER PRIMARY KEY AUTOINCREMENT, "
+                "doc TEXT NOT NULL, "
+                "id TEXT GENERATED ALWAYS AS (json_extract(doc, '$.id')) VIRTUAL)"
+            )
+            conn.execute(f'CREATE INDEX IF NOT EXISTS "{table}_id" ON "{table}" (id)')
+            existing = {row[1] for row in conn.execute(f'PRAGMA table_xinfo("{table}")')}
+            partitioned = DEFAULT_PARTITIONED_INDEXES.get(collection, [])
+            fields = set(self.indexes.get(collection, [])) | set(DEFAULT_ORDERED_INDEXES)
+            fields |= {name for pair in partitioned for name in pair}
+            for field in fields:
+                self._add_column(conn, table, field, existing)
+            for partition, field in partitioned:
+                conn.execute(
+                    f'CREATE INDEX IF NOT EXISTS "{table}_{partition}_{field}" '
+                    f"ON \"{table}\" ({self._column(partition)}, {self._column(field)}, id)"
+                )
+            self._columns[collection] = fields
+    
+    def _add_column(self, conn: sqlite3.Connection, table: str, field: str, existing: set):
+        _check_name(field)
+        if f"f_{field}" not in existing:
+            conn.execute(
+                f'ALTER TABLE "{table}" ADD COLUMN {self._column(field)} '
+                f"GENERATED ALWAYS AS (json_extract(doc, '$.\"{field}\"')) VIRTUAL"
+            )
+        conn.execute(
+            f'CREATE INDEX IF NOT EXISTS "{table}_{field}" ON "{table}" ({self._column(field)})'
+        )
+    
+    def ensure_index(self, collection: str, field: str):
+        """Declare an indexed generated column on collection field"""
+        self.ensure_collection(collection)
+        fields = self.indexes.setdefault(collection, [])
+        if field not in fields:
+            self.indexes[collection] = fields + [field]
+        with self._schema_lock:
+            if field in self._columns[collection]:
+                return
+            conn = self.connection()
+            existing = {row[1] for row in conn.execute(f'PRAGMA table_xinfo("{collection}")')}
+            self._add_column(conn, collection, field, existing)
+            self._columns[collection].add(field)
+            rows = conn.execute(
+                f'SELECT 1 FROM "{collection}" WHERE json_type(doc, \'$."{field}"\') = \'array\' LIMIT 1'
+            ).fetchone()
+            if rows:
+                self._mark_array_field(conn, collection, field)
+    
+    def _mark_array_field(self, conn: sqlite3.Connection, collection: str, field: str):
+        if field in self._array_fields.get(collection, set()):
+            return
+        conn.execute("INSERT OR IGNORE INTO _array_fields VALUES (?, ?)", (collection, field))
+        self._array_fields.setdefault(collection, set()).add(field)
+    
+    def _track_arrays(self, conn: sqlite3.Connection, collection: str, documents: List[dict]):
+        for field in self._columns.get(collection, ()):
+            if any(isinstance(doc.get(field), list) for doc in documents):
+                self._mark_array_field(conn, collection, field)
+    
+    def _counter(self, conn: sqlite3.Connection, collection: str) -> int:
+        row = conn.execute("SELECT version FROM _versions WHERE collection = ?", (collection,)).fetchone()
+        return row[0] if row else 0
+    
+    def _bump(self, conn: sqlite3.Connection, collection: str):
+        """Count a write to collection inside its transaction.
+        
+        The token of collection_version moves along with our own writes,
+        so it only changes when another process wrote in between.
+        """
+        current = self._counter(conn, collection)
+        conn.execute(
+            "INSERT INTO _versions VALUES (?, ?) "
+            "ON CONFLICT(collection) DO UPDATE SET version = excluded.version",
+            (collection, current + 1)
+        )
+        with self._versions_lock:
+            seen = self._versions.get(collection)
+            if seen is not None and seen[0] == current:
+                self._versions[collection] = (current + 1, seen[1])
+    
+    def _rollback(self, conn: sqlite3.Connection, collection: str):
+        conn.execute("ROLLBACK")
+        with self._versions_lock:
+            # The counter may have been advanced for a write that did not happen
+            self._versions.pop(collection, None)
+    
+    def _field_sql(self, collection: str, field: str, condition: Any) -> Optional[Tuple[str, list]]:
+        """Translate one field condition into a SQL superset filter, if indexed"""
+        if field == "id":
+            column = "id"
+        elif field in self._columns.get(collection, ()) and field not in self._array_fields.get(collection, ()):
+            column = self._column(field)
+        else:
+            return None
+        
+        if isinstance(condition, dict) and condition and all(k.startswith("$") for k in condition):
+            parts, params = [], []
+            for op, value in condition.items():
+                if op in ("$eq", "$in"):
+                    values = [value] if op == "$eq" else list(value)
+                    if not all(is_hashable(v) and v is not None for v in values):
+                        continue
+                    if not values:
+                        parts.append("0")
+                    else:
+                        parts.append(f"{column} IN ({', '.join('?' * len(values))})")
+                        params.extend(values)
+                elif op in ("$gt", "$gte", "$lt", "$lte") and is_hashable(value) and value is not None:
+                    sql_op = {"$gt": ">", "$gte": ">=", "$lt": "<", "$lte": "<="}[op]
+                    parts.append(f"{column} {sql_op} ?")
+                    params.append(value)
+            if not parts:
+                return None
+            return " AND ".join(parts), params
+        if not is_hashable(condition) or condition is None:
+            return None
+        return f"{column} = ?", [condition]
+    
+    def _where(self, collection: str, query: dict) -> Tuple[str, list]:
+        """Build a WHERE clause selecting a superset of the rows matching query"""
+        parts, params = [], []
+        for key, value in (query or {}).items():
+            translated = None
+            if key == "$and":
+                branches = [self._where(collection, branch) for branch in value]
+                branches = [b for b in branches if b[0]]
+                if branches:
+                    translated = (
+                        " AND ".join(f"({sql})" for sql, _ in branches),
+                        [p for _, branch_params in branches for p in branch_params]
+                    )
+            elif key == "$or":
+                branches = [self._where(collection, branch) for branch in value]
+                if branches and all(sql for sql, _ in branches):
+                    translated = (
+                        " OR ".join(f"({sql})" for sql, _ in branches),
+                        [p for _, branch_params in branches for p in branch_params]
+                    )
+            elif not key.startswith("$"):
+                translated = self._field_sql(collection, key, value)
+            if translated:
+                parts.append(f"({translated[0]})")
+                params.extend(translated[1])
+        return " AND ".join(parts), params
+    
+    def _select(
+        self,
+        collection: str,
+        query: dict = None,
+        sort: Tuple[str, int] = None,
+        limit: int = None,
+        after: list = None
+    ) -> List[Tuple[int, dict]]:
+        """Get (seq, document) pairs matching query, in insertion order or by sort"""
+        self.ensure_collection(collection)
+        predicate = compile_query(query)
+        where, params = self._where(collection, query)
+        bound = None
+        if sort is None:
+            if after is not None:
+                raise ValueError("after requires sort")
+            order = "seq"
+        else:
+            field, direction = sort
+            _check_name(field)
+            if field in self._columns[collection] and field not in self._array_fields.get(collection, ()):
+                expr = self._column(field)
+            else:
+                expr = f"json_extract(doc, '$.\"{field}\"')"
+            sql_dir = "ASC" if direction >= 0 else "DESC"
+            order = f"{expr} {sql_dir}, id {sql_dir}"
+            if after is not None:
+                bound = (sort_key(after[0]), sort_key(after[1]))
+                if is_hashable(after[0]) and after[0] is not None:
+                    # Lets SQLite seek the index; the exact bound is checked below.
+                    # NULL (missing) sorts first, so descending pages end with it
+                    seek = f"{expr} >= ?" if direction >= 0 else f"({expr} <= ? OR {expr} IS NULL)"
+                    where = f"({where}) AND {seek}" if where else seek
+                    params = params + [after[0]]
+        sql = f'SELECT seq, doc FROM "{collection}"'
+        if where:
+            sql += f" WHERE {where}"
+        sql += f" ORDER BY {order}"
+        rows = self.connection().execute(sql, params)
+        results = []
+        for seq, raw in rows:
+            doc = json.loads(raw)
+            if bound is not None:
+                position = (sort_key(doc.get(field)), sort_key(doc.get("id")))
+                if (position <= bound) if direction >= 0 else (position >= bound):
+                    continue
+            if predicate(doc):
+                results.append((seq, doc))
+                if limit is not None and len(results) >= limit:
+                    break
+        return results
+    
+    def read_collection(self, collection: str) -> List[dict]:
+        """Read all items from collection"""
+        return self.find(collection)
+    
+    def import_collection(self, collection: str, documents: List[dict], replace: bool = False):
+        """Bulk-load documents as they are, used by the JSON migration"""
+        self.ensure_collection(collection)
+        with self._write_lock:
+            conn = self.connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                if replace:
+                    conn.execute(f'DELETE FROM "{collection}"')
+                conn.executemany(
+                    f'INSERT INTO "{collection}" (doc) VALUES (?)',
+                    [(json.dumps(doc),) for doc in documents]
+                )
+                self._track_arrays(conn, collection, documents)
+                self._bump(conn, collection)
+                conn.execute("COMMIT")
+            except Exception:
+                self._rollback(conn, collection)
+                raise
+    
+    def collection_version(self, collection: str) -> Any:
+        """Get a token that is replaced (compare with `is`) when another
+        process wrote to collection"""
+        counter = self._counter(self.connection(), collection)
+        with self._versions_lock:
+            seen = self._versions.get(collection)
+            # A lower counter is our own write still committing
+            if seen is None or counter > seen[0]:
+                seen = self._versions[collection] = (counter, object())
+            return seen[1]
+    
+    def list_collections(self) -> List[str]:
+        """Get names of collection tables"""
+        rows = self.connection().execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' "
+            "AND name NOT LIKE 'sqlite_%' AND name NOT IN ('_array_fields', '_versions') ORDER BY name"
+        )
+        return [name for name, in rows]
+    
+    def warm_up(self) -> Dict[str, dict]:
+        """Prepare every table and read it once into the page cache"""
+        timings = {}
+        for collection in self.list_collections():
+            start = time.perf_counter()
+            self.ensure_collection(collection)
+            documents = self.count(collection)
+            self.connection().execute(f'SELECT COUNT(*) FROM "{collection}" WHERE length(doc) >= 0').fetchone()
+            timings[collection] = {
+                "documents": documents,
+                "ms": round((time.perf_counter() - start) * 1000, 1)
+            }
+        return timings
+    
+    def flush(self) -> Future:
+        """Get a Future for durability of earlier writes (committed synchronously here)"""
+        done = Future()
+        done.set_result(None)
+        return done
+    
+    def close(self):
+        """Close this thread's connection"""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+    
+    def cache_stats(self) -> dict:
+        """Get storage summary (SQLite keeps no collection cache)"""
+        return {"backend": "sqlite", "path": self.path, "collections": len(self._columns)}
+    
+    def find(
+        self,
+        collection: str,
+        query: dict = None,
+        sort: Tuple[str, int] = None,
+        limit: int = None,
+        after: list = None,
+        projection: List[str] = None
+    ) -> List[dict]:
+        """Find items matching query, see JSONDatabase.find"""
+        matched = self._select(collection, query, sort, limit, after)
+        if projection is not None:
+            return [project(doc, projection) for _, doc in matched]
+        return [doc for _, doc in matched]
+    
+    def find_one(self, collection: str, query: dict) -> Optional[dict]:
+        """Find single item matching query"""
+        results = self.find(collection, query, limit=1)
+        return results[0] if results else None
+    
+    def find_by_id(self, collection: str, id: str) -> Optional[dict]:
+        """Find item by ID"""
+        return self.find_one(collection, {"id": id})
+    
+    def insert_one(self, collection: str, document: dict) -> dict:
+        """Insert single document and return it with generated ID"""
+        return self.insert_many(collection, [document])[0]
+    
+    def insert_many(self, collection: str, documents: List[dict]) -> List[dict]:
+        """Insert multiple documents"""
+        for doc in documents:
+            if "id" not in doc:
+                doc["id"] = str(uuid.uuid4())
+            if "createdAt" not in doc:
+                doc["createdAt"] = datetime.utcnow().isoformat()
+        self.import_collection(collection, documents)
+        return [dict(doc) for doc in documents]
+    
+    def update_one(self, collection: str, query: dict, update: dict) -> Optional[dict]:
+        """Update single document"""
+        with self._write_lock:
+            conn = self.connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                matched = self._select(collection, query, limit=1)
+                if not matched:
+                    conn.execute("COMMIT")
+                    return None
+                seq, item = matched[0]
+                updated = {**item, **apply_update(item, update), "updatedAt": datetime.utcnow().isoformat()}
+                conn.execute(f'UPDATE "{collection}" SET doc = ? WHERE seq = ?', (json.dumps(updated), seq))
+                self._track_arrays(conn, collection, [updated])
+                self._bump(conn, collection)
+                conn.execute("COMMIT")
+            except Exception:
+                self._rollback(conn, collection)
+                raise
+        return updated
+    
+    def update_by_id(self, collection: str, id: str, update: dict) -> Optional[dict]:
+        """Update document by ID"""
+        return self.update_one(collection, {"id": id}, update)
+    
+    def update_many(self, collection: str, query: dict, update: dict) -> int:
+        """Update every document matching query in one transaction"""
+        with self._write_lock:
+            conn = self.connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                matched = self._select(collection, query)
+                now = datetime.utcnow().isoformat()
+                updated = [{**item, **apply_update(item, update), "updatedAt": now} for _, item in matched]
+                conn.executemany(
+                    f'UPDATE "{collection}" SET doc = ? WHERE seq = ?',
+                    [(json.dumps(doc), seq) for doc, (seq, _) in zip(updated, matched)]
+                )
+                self._track_arrays(conn, collection, updated)
+                self._bump(conn, collection)
+                conn.execute("COMMIT")
+            except Exception:
+                self._rollback(conn, collection)
+                raise
+        return len(matched)
+    
+    def bulk_write(
+        self,
+        collection: str,
+        updates: List[Tuple[dict, dict]] = (),
+        inserts: List[dict] = (),
+        upserts: List[dict] = (),
+        upsert_key: Sequence[str] = ("id",)
+    ) -> Tuple[List[dict], List[dict]]:
+        """Apply (query, update) pairs like update_many, then inserts and
+        upserts, in one transaction; see JSONDatabase.bulk_write"""
+        now = datetime.utcnow().isoformat()
+        inserted = list(inserts)
+        for doc in inserts:
+            doc.setdefault("id", str(uuid.uuid4()))
+            doc.setdefault("createdAt", now)
+        self.ensure_collection(collection)
+        updated = []
+        with self._write_lock:
+            conn = self.connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                for query, update in updates:
+                    matched = self._select(collection, query)
+                    docs = [{**item, **apply_update(item, update), "updatedAt": now} for _, item in matched]
+                    conn.executemany(
+                        f'UPDATE "{collection}" SET doc = ? WHERE seq = ?',
+                        [(json.dumps(doc), seq) for doc, (seq, _) in zip(docs, matched)]
+                    )
+                    self._track_arrays(conn, collection, docs)
+                    updated.extend(docs)
+                conn.executemany(
+                    f'INSERT INTO "{collection}" (doc) VALUES (?)',
+                    [(json.dumps(doc),) for doc in inserts]
+                )
+                for upsert in upserts:
+                    matched = self._select(collection, {field: upsert[field] for field in upsert_key})
+                    if matched:
+                        seq, item = max(matched, key=lambda match: str(match[1].get("createdAt") or ""))
+                        changes = apply_update(item, upsert)
+                        if all(field in item and item[field] == value for field, value in changes.items()):
+                            continue
+                        updated.append({**item, **changes, "updatedAt": now})
+                        conn.execute(f'UPDATE "{collection}" SET doc = ? WHERE seq = ?', (json.dumps(updated[-1]), seq))
+                    else:
+                        doc = apply_update({}, upsert, inserting=True)
+                        doc.setdefault("id", str(uuid.uuid4()))
+                        doc.setdefault("createdAt", now)
+                        inserted.append(doc)
+                        conn.execute(f'INSERT INTO "{collection}" (doc) VALUES (?)', (json.dumps(doc),))
+                self._track_arrays(conn, collection, inserted + updated)
+                if inserted or updated:
+                    self._bump(conn, collection)
+                conn.execute("COMMIT")
+            except Exception:
+                self._rollback(conn, collection)
+                raise
+        return updated, [dict(doc) for doc in inserted]
+    
+    def delete_one(self, collection: str, query: dict) -> bool:
+        """Delete single document"""
+        with self._write_lock:
+            conn = self.connection()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                removed = self._select(collection, query)
+                conn.executemany(f'DELETE FROM "{collection}" WHERE seq = ?', [(seq,) for seq, _ in removed])
+                self._bump(conn, collection)
+                conn.execute("COMMIT")
+            except Exception:
+                self._rollback(conn, collection)
+                raise
+        return bool(removed)
+    
+    def delete_by_id(self, collection: str, id: str) -> bool:
+        """Delete document by ID"""
+        return self.delete_one(collection, {"id": id})
+    
+    def count(self, collection: str, query: dict = None) -> int:
+        """Count documents in collection"""
+        if not query:
+            self.ensure_collection(collection)
+            return self.connection().execute(f'SELECT COUNT(*) FROM "{collection}"').fetchone()[0]
+        return len(self._select(collection, query))
@@ -0,0 +1,115 @@
+"""On-disk formats for JSONDatabase collection snapshots"""
+import json
+import struct
+import zlib
+from typing import BinaryIO, Dict, List
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+class Codec:
+    """Serializes a collection (list of documents) to a binary file object"""
+    
+    name = ""
+    extension = ".json"
+    
+    def dump(self, documents: List[dict], f: BinaryIO):
+        raise NotImplementedError
+    
+    def load(self, f: BinaryIO) -> List[dict]:
+        raise NotImplementedError
+
+class PrettyJSONCodec(Codec):
+    """Indented JSON, the original format"""
+    
+    name = "json-pretty"
+    
+    def dump(self, documents: List[dict], f: BinaryIO):
+        f.write(json.dumps(documents, indent=2).encode("utf-8"))
+    
+    def load(self, f: BinaryIO) -> List[dict]:
+        return json.load(f)
+
+class CompactJSONCodec(PrettyJSONCodec):
+    """JSON without whitespace"""
+    
+    name = "json"
+    
+    def dump(self, documents: List[dict], f: BinaryIO):
+        f.write(json.dumps(documents, separators=(",", ":")).encode("utf-8"))
+
+class OrjsonCodec(Codec):
+    """Compact JSON through orjson, readable by every JSON codec"""
+    
+    name = "orjson"
+    
+    def dump(self, documents: List[dict], f: BinaryIO):
+        f.write(orjson.dumps(documents))
+    
+    def load(self, f: BinaryIO) -> List[dict]:
+        return orjson.loads(f.read())
+
+class BinaryCodec(Codec):
+    """Length-prefixed binary snapshot.
+    
+    Layout: magic, format version, CRC32 and length of the payload, then
+    one record per document: its UTF-8 JSON (through orjson if installed)
+    prefixed with a 4-byte length. The records are plain JSON, so the
+    file stays readable across Python versions; the checksum rejects torn
+    or foreign files.
+    """
+    
+    name = "binary"
+    extension = ".bin"
+    MAGIC = b"EDB2"
+    HEADER = struct.Struct("<4sBIQ")
+    RECORD = struct.Struct("<I")
+    VERSION = 1
+    
+    @staticmethod
+    def _encode(doc: dict) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(doc)
+        return json.dumps(doc, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    
+    def dump(self, documents: List[dict], f: BinaryIO):
+        records = [self._encode(doc) for doc in documents]
+        payload = b"".join(part for record in records for part in (self.RECORD.pack(len(record)), record))
+        f.write(self.HEADER.pack(self.MAGIC, self.VERSION, zlib.crc32(payload), len(payload)))
+        f.write(payload)
+    
+    def load(self, f: BinaryIO) -> List[dict]:
+        header = f.read(self.HEADER.size)
+        if len(header) != self.HEADER.size:
+            raise ValueError("Truncated snapshot header")
+        magic, version, checksum, length = self.HEADER.unpack(header)
+        if magic != self.MAGIC or version != self.VERSION:
+            raise ValueError("Not a binary collection snapshot")
+        payload = f.read(length)
+        if len(payload) != length or zlib.crc32(payload) != checksum:
+            raise ValueError("Corrupt snapshot payload")
+        loads = orjson.loads if orjson is not None else json.loads
+        documents = []
+        offset = 0
+        while offset < length:
+            (size,) = self.RECORD.unpack_from(payload, offset)
+            offset += self.RECORD.size
+            documents.append(loads(payload[offset:offset + size]))
+            offset += size
+        return documents
+
+CODECS: Dict[str, Codec] = {
+    codec.name: codec
+    for codec in (PrettyJSONCodec(), CompactJSONCodec(), OrjsonCodec(), BinaryCodec())
+}
+
+def get_codec(name: str) -> Codec:
+    """Get codec by name, falling back to compact JSON when orjson is missing"""
+    if name not in CODECS:
+        raise ValueError(f"Unknown storage codec: {name} (choose from {', '.join(CODECS)})")
+    if name == "orjson" and orjson is None:
+        print("⚠️  orjson o'rnatilmagan, json codec ishlatiladi")
+        return CODECS["json"]
+    return CODECS[name]